@@ -0,0 +1,2 @@
+#!/usr/bin/env bash
+PYTHONPATH=$PYTHONPATH:src python src/acquisition_benchmark.py "$@"
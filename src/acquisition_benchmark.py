@@ -0,0 +1,237 @@
+
+#
+#  Headless benchmark of the acquisition pipeline on synthetic frames:
+#    - packet decoding (per packet and batched)
+#    - AES decryption (per 16-byte block and bulk)
+#    - SignalBuffer.pull_packets drain rate
+#    - SignalWriter packet rate
+#    - SignalRendererWidget.draw frame time for 1 to 14 channels in the
+#      time series and the spectrum modes
+#  The results are printed and optionally stored as JSON so that they
+#  can be compared across releases.
+#
+#  usage: acquisition_benchmark.py [--json results.json] [--quick] [benchmark ...]
+#  (see acquisition-benchmark.sh for the required PYTHONPATH)
+#
+
+import os
+import json
+import time
+import tempfile
+import platform
+import argparse
+
+# render without a display
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np
+import pygame
+
+from emotiv_data_packet import EmotivDataPacket, decode_frames, DecodedFrames, FRAME_SIZE
+from emotiv_device import EmotivDevice, make_aes_cipher
+from emotiv_simulator import EmotivSimulator
+from signal_buffer import SignalBuffer
+from signal_writer import SignalWriter
+
+
+SERIAL_NUM = 'SN20120229000254'
+
+
+def best_time(func, repeat):
+    """
+    Run func repeat times and return the best wall clock time in seconds.
+    """
+    best = None
+    for i in range(repeat):
+        t0 = time.time()
+        func()
+        dt = time.time() - t0
+        if best is None or dt < best:
+            best = dt
+    return best
+
+
+class AcquisitionBenchmark:
+    """
+    Runs the benchmarks and collects their results.
+    """
+
+    def __init__(self, frame_cnt = 128 * 60, repeat = 5):
+        """
+        Prepare frame_cnt synthetic frames (encrypted and decrypted), each
+        benchmark is repeated repeat times and the best run counts.
+        """
+        self.frame_cnt = frame_cnt
+        self.repeat = repeat
+        self.results = []
+
+        self.enc_data = EmotivSimulator(SERIAL_NUM).frames(frame_cnt)
+        self.raw_data = make_aes_cipher(SERIAL_NUM).decrypt(self.enc_data)
+        self.raw_frames = [ self.raw_data[i:i+FRAME_SIZE] for i in range(0, len(self.raw_data), FRAME_SIZE) ]
+
+
+    def report(self, name, value, unit, **params):
+        """
+        Record and print a result.
+        """
+        self.results.append({ 'name' : name, 'value' : value, 'unit' : unit, 'params' : params })
+        print('%-24s %-36s %14.1f %s' % (name, ' '.join('%s=%s' % kv for kv in sorted(params.items())),
+                                         value, unit))
+
+
+    def bench_decode(self):
+        n = self.frame_cnt
+
+        def per_packet():
+            for raw in self.raw_frames:
+                EmotivDataPacket(raw).eeg
+
+        out = DecodedFrames(n)
+        def batched():
+            decode_frames(self.raw_data, out)
+
+        self.report('decode', n / best_time(per_packet, self.repeat), 'packets/s', mode = 'packet')
+        self.report('decode', n / best_time(batched, self.repeat), 'packets/s', mode = 'batch')
+
+
+    def bench_aes(self):
+        aes = make_aes_cipher(SERIAL_NUM)
+        enc = self.enc_data
+        mb = len(enc) / 1e6
+
+        def per_block():
+            for i in range(0, len(enc), 16):
+                aes.decrypt(enc[i:i+16])
+
+        def bulk():
+            aes.decrypt(enc)
+
+        self.report('aes_decrypt', mb / best_time(per_block, self.repeat), 'MB/s', mode = 'block')
+        self.report('aes_decrypt', mb / best_time(bulk, self.repeat), 'MB/s', mode = 'bulk')
+
+
+    def make_device(self):
+        """
+        A device that is never started, fed with the synthetic frames.
+        """
+        dev = EmotivDevice(SERIAL_NUM, '/nonexistent', queue_packets = False,
+                           ring_len = self.frame_cnt)
+        dev.reset_packet_speed()
+        return dev
+
+
+    def bench_pull(self):
+        dev = self.make_device()
+        levels = decode_frames(self.raw_data)[0].eeg
+
+        for backlog in (6, 128, 128 * 10):
+            sb = SignalBuffer(768, 14)
+            block = levels[:backlog]
+
+            # only the pulls are timed, the ring is refilled in between
+            best = None
+            for r in range(self.repeat):
+                dt = 0.0
+                for i in range(100):
+                    for row in block:
+                        dev.samples.push(row)
+                    t0 = time.time()
+                    sb.pull_packets(dev)
+                    dt += time.time() - t0
+                best = dt if best is None else min(best, dt)
+
+            self.report('pull_packets', 100 * backlog / best, 'samples/s', backlog = backlog)
+
+
+    def bench_writer(self):
+        packets = [ EmotivDataPacket(raw) for raw in self.raw_frames ]
+        fd, fname = tempfile.mkstemp(suffix = '.rec')
+        os.close(fd)
+
+        try:
+            def write():
+                w = SignalWriter()
+                w.open(fname, SERIAL_NUM)
+                for p in packets:
+                    w.write_packet(p)
+                w.close()
+
+            def write_only():
+                w = SignalWriter()
+                w.open(fname, SERIAL_NUM)
+                t0 = time.time()
+                for p in packets:
+                    w.write_packet(p)
+                self.write_only_dt = time.time() - t0
+                w.close()
+
+            n = len(packets)
+            self.report('signal_writer', n / best_time(write, self.repeat), 'records/s', mode = 'with_close')
+            write_only()
+            self.report('signal_writer', n / self.write_only_dt, 'records/s', mode = 'write_packet')
+        finally:
+            os.remove(fname)
+
+
+    def bench_render(self):
+        from signal_renderer_widget import SignalRendererWidget
+        from emotiv_data_packet import counter_to_sensor_id
+
+        pygame.init()
+        surf = pygame.Surface((880, 660))
+        dev = self.make_device()
+        sb = SignalBuffer(768, 14, slack = 128, track_stats = True)
+        levels = decode_frames(self.raw_data)[0].eeg
+        sb.append(levels)
+        renderer = SignalRendererWidget(counter_to_sensor_id, dev, sb, pygame.Rect(0, 0, 880, 660))
+
+        for mode, mode_name in ((0, 'time_series'), (1, 'spectrum')):
+            for chan_cnt in (1, 2, 4, 8, 14):
+                renderer.select_channels(range(chan_cnt))
+                renderer.display_type = [ mode ] * 14
+
+                # about 6 new samples per frame as at 20 frames/s
+                def draw():
+                    for i in range(10):
+                        sb.append(levels[6*i:6*i+6])
+                        renderer.draw(surf)
+
+                dt = best_time(draw, self.repeat) / 10
+                self.report('render', dt * 1000.0, 'ms/frame', mode = mode_name, channels = chan_cnt)
+
+
+    def run(self, names = None):
+        """
+        Run the selected benchmarks (all by default).
+        """
+        for name in names or [ 'decode', 'aes', 'pull', 'writer', 'render' ]:
+            getattr(self, 'bench_' + name)()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Benchmark the acquisition pipeline.')
+    parser.add_argument('--json', metavar = 'FILE', help = 'store the results as JSON')
+    parser.add_argument('--quick', action = 'store_true', help = 'fewer frames and repetitions')
+    parser.add_argument('benchmarks', nargs = '*',
+                        help = 'benchmarks to run: decode, aes, pull, writer, render (default: all)')
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        if not hasattr(AcquisitionBenchmark, 'bench_' + name):
+            parser.error('unknown benchmark %s' % name)
+
+    if args.quick:
+        bench = AcquisitionBenchmark(128 * 10, 2)
+    else:
+        bench = AcquisitionBenchmark()
+    bench.run(args.benchmarks)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({ 'timestamp' : time.time(),
+                        'python' : platform.python_version(),
+                        'numpy' : np.__version__,
+                        'platform' : platform.platform(),
+                        'frame_cnt' : bench.frame_cnt,
+                        'results' : bench.results }, f, indent = 2)
@@ -0,0 +1,131 @@
+
+#
+#  Real-time EEG band powers.  A BandPowerMonitor follows a SignalBuffer
+#  and keeps a running Welch estimate per channel and band:
+#    - every hop samples one new segment is transformed (one FFT for all
+#      channels), older segments are never recomputed
+#    - the band powers of the last avg_cnt segments are averaged by a
+#      running sum
+#    - after each hop the (channels, bands) averages are published to the
+#      subscribers
+#
+
+import numpy as np
+
+import spectral_analysis
+from spectral_analysis import EEG_BANDS
+
+
+class BandPowerMonitor:
+    """
+    Running Welch band power estimates of all channels of a SignalBuffer.
+    """
+
+    def __init__(self, sig_buf, seg_len = 256, overlap = 0.5, avg_cnt = 8,
+                 sample_rate = 128.0, bands = EEG_BANDS, window = 'hann'):
+        """
+        Follow sig_buf with segments of seg_len samples overlapping by the
+        fraction overlap, the published powers [levels^2] are averaged over
+        the last avg_cnt segments.  The bands are (name, low, high) triples.
+        """
+        if seg_len > sig_buf.capacity:
+            raise ValueError('segment of %d samples exceeds capacity %d' % (seg_len, sig_buf.capacity))
+        if not 0.0 <= overlap < 1.0:
+            raise ValueError('overlap must be in [0, 1)')
+
+        self.sig_buf = sig_buf
+        self.seg_len = seg_len
+        self.hop = max(1, seg_len - int(round(overlap * seg_len)))
+        self.avg_cnt = avg_cnt
+        self.sample_rate = sample_rate
+        self.bands = bands
+        self.band_names = [ b[0] for b in bands ]
+        self.window = window
+        self.subscribers = []
+
+        self.seg_powers = np.zeros((avg_cnt, sig_buf.sig_cnt, len(bands)))
+        self.power_sum = np.zeros((sig_buf.sig_cnt, len(bands)))
+        self.powers = np.zeros((sig_buf.sig_cnt, len(bands)))
+        self.reset()
+
+
+    def reset(self):
+        """
+        Forget all segments, the next segment ends seg_len samples after
+        the current end of the buffer.
+        """
+        self.epoch = self.sig_buf.epoch
+        self.next_end = self.sig_buf.total + self.seg_len
+        self.seg_cnt = 0
+        self.lost = 0
+        self.seg_powers[:] = 0.0
+        self.power_sum[:] = 0.0
+        self.powers[:] = 0.0
+
+
+    def update(self):
+        """
+        Process all segments completed since the last update, publishes
+        the averages once for each segment.  Returns the number of
+        segments processed.
+        """
+        sb = self.sig_buf
+        if sb.epoch != self.epoch:
+            self.reset()
+
+        # segments overwritten before they could be processed are skipped
+        total = sb.total
+        oldest_end = total - sb.capacity + self.seg_len
+        if self.next_end < oldest_end:
+            skip = -(-(oldest_end - self.next_end) // self.hop)
+            self.lost += skip
+            self.next_end += skip * self.hop
+
+        done = 0
+        while self.next_end <= total:
+            win = sb.window(self.seg_len, self.next_end)
+            psd = spectral_analysis.power_spectra(win.data, self.sample_rate, self.window)
+            seg = spectral_analysis.band_powers(psd, self.seg_len, self.sample_rate, self.bands)
+
+            # replace the oldest segment in the running sum
+            ndx = self.seg_cnt % self.avg_cnt
+            self.power_sum += seg - self.seg_powers[ndx]
+            self.seg_powers[ndx] = seg
+            self.seg_cnt += 1
+
+            # resynchronize the running sum to keep rounding errors bounded
+            if ndx == self.avg_cnt - 1:
+                self.power_sum[:] = np.sum(self.seg_powers, axis = 0)
+            self.powers[:] = self.power_sum / min(self.seg_cnt, self.avg_cnt)
+
+            for sub_callback in self.subscribers:
+                sub_callback(self.powers)
+
+            self.next_end += self.hop
+            done += 1
+
+        return done
+
+
+    def relative_powers(self):
+        """
+        Return the band powers of each channel as fractions of the total
+        power in all bands.
+        """
+        total = np.sum(self.powers, axis = 1)[:, np.newaxis]
+        total[total == 0] = 1.0
+        return self.powers / total
+
+
+    def subscribe(self, tgt):
+        """
+        Subscribe to the (channels, bands) band powers published each hop,
+        the same array is updated in place on every hop.
+        """
+        self.subscribers.append(tgt)
+
+    def unsubscribe(self, tgt):
+        """
+        Unsubscribe from the band powers.
+        """
+        self.subscribers.remove(tgt)
@@ -36,9 +36,129 @@ sensor_id_to_ndx = { 'F3' : 0, 'FC5' : 1, 'AF3' : 2, 'F7' : 3, 'T7' : 4, 'P7' :
 counter_to_sensor_id = [ 'F3', 'FC5', 'AF3', 'F7', 'T7', 'P7', 'O1', 'O2',
                          'P8', 'T8', 'F8', 'AF4', 'FC6', 'F4' ]
 
+# size of one decrypted frame in bytes
+FRAME_SIZE = 32
 
 
-class EmotivDataPacket:
+def build_decoder_tables():
+    """
+    Translate sensor_bits into a gather table and bit weights so that all
+    14 EEG channels and the CQ level can be decoded in one go from the
+    np.unpackbits() expansion of the 32-byte frame.  Row i of the gather
+    table holds the bit positions of channel counter_to_sensor_id[i], the
+    last row holds the bit positions of the CQ level.
+    """
+    bits = np.array([ sensor_bits[s] for s in counter_to_sensor_id + [ 'CQ' ] ])
+
+    # sensor_bits index the bits of raw_data[1:] with bit 0 as the LSB,
+    # np.unpackbits() places the MSB of each byte first
+    gather = (bits // 8 + 1) * 8 + (7 - bits % 8)
+    weights = 2 ** np.arange(14)
+    return gather, weights
+
+
+# the decoder tables are computed once at import time
+decoder_gather, decoder_weights = build_decoder_tables()
+
+
+def decode_levels(raw_data):
+    """
+    Decode the 14 EEG levels and the CQ level of a single decrypted frame.
+    Returns an integer array of length 15 ordered as counter_to_sensor_id
+    with the CQ level last.
+    """
+    bits = np.unpackbits(np.frombuffer(raw_data, dtype = np.uint8))
+    return bits[decoder_gather].dot(decoder_weights)
+
+
+class DecodedFrames:
+    """
+    Caller-owned arrays holding the contents of a run of decoded frames,
+    one row per frame:
+      - eeg: EEG levels ordered as counter_to_sensor_id (N x 14)
+      - counter: packet counter, 128 for battery packets
+      - gyro: gyro positions X,Y (N x 2)
+      - battery: battery level, NaN if the frame carries none
+      - cq: contact quality level of channel counter, NaN if none
+    """
+
+    def __init__(self, n, dtype = np.float):
+        """
+        Allocate room for n frames, the EEG levels are stored as dtype
+        (e.g. np.uint16 or np.int16 for raw levels, they fit in 14 bits).
+        """
+        self.eeg = np.zeros((n, 14), dtype = dtype)
+        self.counter = np.zeros((n,), dtype = np.int)
+        self.gyro = np.zeros((n, 2), dtype = np.int)
+        self.battery = np.zeros((n,), dtype = np.float)
+        self.cq = np.zeros((n,), dtype = np.float)
+
+
+    def __len__(self):
+        return self.counter.shape[0]
+
+
+def decode_frames(raw, out = None, dtype = np.float):
+    """
+    Decode a contiguous run of decrypted frames (a string, bytearray or
+    memoryview of a multiple of FRAME_SIZE bytes) in one vectorized pass.
+    The results are stored in the first rows of out (a DecodedFrames
+    instance), which is allocated with EEG levels of type dtype if not
+    supplied.  Returns out and the number of decoded frames.
+    """
+    n = len(raw) // FRAME_SIZE
+    if out is None:
+        out = DecodedFrames(n, dtype)
+    elif len(out) < n:
+        raise ValueError('output holds %d frames, %d required' % (len(out), n))
+
+    # np.frombuffer() does not accept memoryviews under python 2
+    if isinstance(raw, memoryview):
+        frames = np.asarray(raw)[:n * FRAME_SIZE]
+    else:
+        frames = np.frombuffer(raw, dtype = np.uint8, count = n * FRAME_SIZE)
+    frames = frames.reshape((n, FRAME_SIZE))
+    levels = np.unpackbits(frames, axis = 1)[:, decoder_gather].dot(decoder_weights)
+
+    # counters over 127 carry the battery status and mark packet 128
+    counter = frames[:, 0].astype(np.int)
+    batt = counter > 127
+    out.counter[:n] = np.where(batt, 128, counter)
+    out.battery[:n] = np.where(batt, np.clip((counter - 225.0) / (248.0 - 225.0), 0.0, 1.0), np.nan)
+
+    out.gyro[:n, 0] = frames[:, 29]
+    out.gyro[:n, 1] = frames[:, 30]
+    out.eeg[:n, :] = levels[:, :14]
+
+    # the CQ level is only valid for packets 0 to 13
+    out.cq[:n] = np.where(out.counter[:n] < 14, levels[:, 14], np.nan)
+
+    return out, n
+
+
+
+def encode_frames(counter, gyro_x, gyro_y, levels):
+    """
+    Inverse of decode_frames: build a string of decrypted frames from the
+    raw counter bytes, the gyro positions and the levels (N x 15, the 14
+    EEG levels ordered as counter_to_sensor_id followed by the CQ level).
+    Bits not covered by these fields are zero.
+    """
+    levels = np.asarray(levels, dtype = np.int)
+    n = levels.shape[0]
+
+    # scatter the level bits into their positions & pack the bits
+    bits = np.zeros((n, FRAME_SIZE * 8), dtype = np.uint8)
+    bits[:, decoder_gather] = (levels[:, :, np.newaxis] >> np.arange(14)) & 1
+    frames = np.packbits(bits, axis = 1)
+
+    frames[:, 0] = counter
+    frames[:, 29] = gyro_x
+    frames[:, 30] = gyro_y
+    return frames.tostring()
+
+
+class EmotivDataPacket(object):
     """
     The EEG signals are stored as floats in the data packet in anticipation
     of further processing.  The data packet contains:
@@ -46,60 +166,120 @@ class EmotivDataPacket:
       - EEG contact quality once per second (TODO)
       - Gyro positions X,Y (128Hz)
       - Battery levels (once per second)
+
+    The packet only keeps the raw 32-byte frame, the fields are decoded
+    from it on access (the EEG levels are decoded on first access and
+    cached).  The slots keep queued packets small.  The type of the EEG
+    array is given by eeg_dtype, set it to e.g. np.float32 or np.uint16
+    to store the levels more compactly.
     """
 
+    __slots__ = ('raw', '_levels', '_eeg')
+
+    eeg_dtype = np.float
+
+
     def __init__(self, raw_data):
         """
         Initialize the packet with raw data read in from the device.
         """
+        self.raw = raw_data
+        self._levels = None
+        self._eeg = None
+
+
+    @property
+    def counter(self):
+        """
+        Packet counter is first byte [0..127], if counter > 127, then it's
+        the battery status and the packet number is 128.
+        """
+        counter = ord(self.raw[0])
+        return 128 if counter > 127 else counter
 
-        # packet counter is first byte [0..127]
-        counter = ord(raw_data[0])
 
-        # if counter > 127, then it's the battery status
-        # and the packet number is 128
+    @property
+    def battery(self):
+        """
+        Battery level [0..1] for packet 128, None otherwise.
+        """
+        counter = ord(self.raw[0])
         if counter > 127:
-            self.battery = max(min(1.0, (float(counter) - 225.0) / (248.0 - 225.0)), 0.0)
-            self.counter = 128
-        else:
-            self.battery = None
-            self.counter = counter
+            return max(min(1.0, (float(counter) - 225.0) / (248.0 - 225.0)), 0.0)
+        return None
 
+
+    @property
+    def sync(self):
         # what's this?
-        self.sync = (self.counter == 0xe9)
-
-        # decode gyro positions
-        self.gyro_x = ord(raw_data[29])
-        self.gyro_y = ord(raw_data[30])
-
-        # allocate numpy array for eeg samples & decode data into it
-        # each electrode is a 14-bit value (??)
-        self.eeg = np.zeros((14,), dtype = np.float)
-        for i in range(14):
-          self.eeg[i] = self.get_bits_from_raw(raw_data, sensor_bits[counter_to_sensor_id[i]])
-          
-        # read out the CQ for packets 0 to 13
-        if self.counter < 14:
-            self.cq_id = counter_to_sensor_id[self.counter]
-            self.cq_val = self.get_bits_from_raw(raw_data, sensor_bits['CQ'])
-#            self.cq_val = None
-        else:
-            self.cq_id = None
-            self.cq_val = None
-
-        
+        return self.counter == 0xe9
+
+
+    @property
+    def gyro_x(self):
+        return ord(self.raw[29])
+
+
+    @property
+    def gyro_y(self):
+        return ord(self.raw[30])
+
+
+    @property
+    def levels(self):
+        """
+        The 14 EEG levels followed by the CQ level as decoded by
+        decode_levels(), decoded once on first access.
+        """
+        if self._levels is None:
+            self._levels = decode_levels(self.raw)
+        return self._levels
+
+
+    @property
+    def eeg(self):
+        """
+        The EEG levels as eeg_dtype ordered as counter_to_sensor_id.
+        Each electrode is a 14-bit value (??)
+        """
+        if self._eeg is None:
+            self._eeg = self.levels[:14].astype(self.eeg_dtype)
+        return self._eeg
+
+
+    @property
+    def cq_id(self):
+        """
+        Channel of the CQ level carried by packets 0 to 13, None otherwise.
+        """
+        counter = self.counter
+        return counter_to_sensor_id[counter] if counter < 14 else None
+
+
+    @property
+    def cq_val(self):
+        """
+        CQ level carried by packets 0 to 13, None otherwise.
+        """
+        return float(self.levels[14]) if self.counter < 14 else None
+
+
     def __getattr__(self, attr):
         """
         Return the sample for the requested channel id.
         """
-        return self.eeg[sensor_id_to_ndx[attr]]
+        try:
+            return self.eeg[sensor_id_to_ndx[attr]]
+        except KeyError:
+            raise AttributeError(attr)
 
 
     def get_bits_from_raw(self, raw_data, bit_list):
         """
-        Routine copied practically verbatim from emotiv.py, probably does not
-        need to be more effective/faster.  Returns the 14-bit level of the
-        signal (baseline seems to be 2**12).
+        Routine copied practically verbatim from emotiv.py.  Returns the
+        14-bit level of the signal (baseline seems to be 2**12).  The packet
+        is decoded using decode_levels(), this bit-by-bit version is kept
+        as the reference implementation of the bit layout.
         """
         level = 0
         for i in range(13, -1, -1):
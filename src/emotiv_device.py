@@ -3,11 +3,14 @@
 #  This class is responsible for:
 #    - reading in the raw packet data from the /dev/eeg/encrypted device
 #    - decrypting the signal (two 16-byte packets, ECB mode AES)
-#    - queuing the decoded packets for buffer pull requests
+#    - passing the samples to the sample ring for buffer pull requests
+#    - queuing the decoded packets for packet consumers
 #    - forwarding the packets to registered subscribers
 #    - passing the packets to the EmotivDevice for updating
 #
 
+import os
+import io
 import string
 import threading
 import select
@@ -15,10 +18,39 @@ import traceback
 import time
 
 import Queue
+import numpy as np
 from Crypto.Cipher import AES
 
 
-from emotiv_data_packet import EmotivDataPacket, counter_to_sensor_id
+from emotiv_data_packet import EmotivDataPacket, counter_to_sensor_id, FRAME_SIZE
+from packet_queue import PacketQueue, DROP_OLDEST, BLOCK
+from sample_ring import SampleRing
+
+
+def make_aes_cipher(sn):
+    """
+    This routine is again taken from emokit.py, specialized
+    for only the research headset and modified to use PyCrypto.
+    Returns the AES cipher for the headset with serial number sn.
+    """
+    k = ['\0'] * 16
+    k[0] = sn[-1]
+    k[1] = '\0'
+    k[2] = sn[-2]
+    k[3] = 'T'
+    k[4] = sn[-3]
+    k[5] = '\x10'
+    k[6] = sn[-4]
+    k[7] = 'B'
+    k[8] = sn[-1]
+    k[9] = '\0'
+    k[10] = sn[-2]
+    k[11] = 'H'
+    k[12] = sn[-3]
+    k[13] = '\0'
+    k[14] = sn[-4]
+    k[15] = 'P'
+    return AES.new(string.join(k, ''), AES.MODE_ECB)
 
 
 class EmotivDevice:
@@ -26,20 +58,33 @@ class EmotivDevice:
     This class is responsible for:
       - reading in the raw packet data from the /dev/eeg/encrypted device
       - decrypting the signal (two 16-byte packets, ECB mode AES)
-      - queuing the decoded packets for buffer pull requests
+      - passing the samples to the sample ring for buffer pull requests
+      - queuing the decoded packets for packet consumers
       - forwarding the packets to registered subscribers
       - interpreting the packets to update the device state (battery, contact quality, gyro readouts)
     """
 
 
-    def __init__(self, serial_num, in_dev_name = '/dev/eeg/encrypted'):
+    def __init__(self, serial_num, in_dev_name = '/dev/eeg/encrypted', max_batch = 64,
+                 queue_len = 128 * 60, overflow = DROP_OLDEST, queue_packets = True,
+                 ring_len = 128 * 60, dtype = np.float):
         """
-        Initialize the Emotiv device with its serial number.
+        Initialize the Emotiv device with its serial number.  At most
+        max_batch ready frames are read and decrypted together.  The packet
+        queue holds at most queue_len packets (one minute by default, 0 for
+        unbounded), overflow selects the policy applied when it is full
+        (see packet_queue).  Packets are only queued if queue_packets is
+        set, the EEG samples are always passed to the sample ring (which
+        holds ring_len samples of type dtype) for SignalBuffer pulls.
         """
+        self.serial_num = serial_num
         self.in_dev_name = in_dev_name
+        self.max_batch = max_batch
+        self.queue_packets = queue_packets
 
         # permanent objects
-        self.packet_queue = Queue.Queue()
+        self.packet_queue = PacketQueue(queue_len, overflow)
+        self.samples = SampleRing(ring_len, 14, dtype)
         self.setup_aes_cipher(serial_num)
 
         # setup state-dependent objects
@@ -57,13 +102,26 @@ class EmotivDevice:
         while not self.packet_queue.empty():
             self.packet_queue.get()
             self.packet_queue.task_done()
+        self.packet_queue.dropped = 0
+        self.samples.clear()
         self.subscribers = []
         self.stop_requested = False
         self.running = False
         self.reader = None
+        self.loop_file = None
+        self.remove_reader = None
+        self.hub = None
         self.packet_speed = 0.0
 
 
+    @property
+    def dropped_packets(self):
+        """
+        Number of packets discarded because the packet queue was full.
+        """
+        return self.packet_queue.dropped
+
+
     def start_reader(self):
         """
         Start the reader thread.
@@ -84,6 +142,14 @@ class EmotivDevice:
         if not self.running:
             return
 
+        # served from an event loop or a hub, not by a reader thread
+        if self.loop_file is not None:
+            self.detach()
+            return
+        if self.hub is not None:
+            self.hub.remove_device(self)
+            return
+
         # request stop here
         self.stop_requested = True
 
@@ -94,14 +160,121 @@ class EmotivDevice:
         # the reader thread resets running & stop_requested flags
 
 
-    def read_data(self):
+    def attach(self, add_reader, remove_reader):
+        """
+        Serve the device from an external event loop instead of the reader
+        thread.  add_reader(fd, callback) must arrange for callback() to be
+        called whenever fd is readable and remove_reader(fd) must undo it
+        (e.g. the add_reader/remove_reader methods of an asyncio loop).
+        Packets are then delivered to the subscribers on the loop thread.
+        The loop must not block on a full packet queue, so a queue with
+        the BLOCK overflow policy raises a ValueError.  Loop code drains
+        the queue with read_available() and should call check_idle()
+        from a timer, as the loop does not notice a silent device.
+        """
+        # if already started, return immediately
+        if self.running:
+            return
+
+        if self.queue_packets and self.packet_queue.policy == BLOCK:
+            raise ValueError('a blocking packet queue would stall the event loop')
+
+        self.loop_file = self.open_device()
+        self.remove_reader = remove_reader
+        self.running = True
+        add_reader(self.loop_file.fileno(), self.loop_readable)
+
+
+    def detach(self):
+        """
+        Stop serving the device from the event loop and close it.
+        """
+        if self.loop_file is None:
+            return
+
+        self.remove_reader(self.loop_file.fileno())
+        self.loop_file.close()
+        self.loop_file = None
+        self.remove_reader = None
+        self.running = False
+        self.packet_speed = 0.0
+
+
+    def check_idle(self, timeout = 0.1):
+        """
+        Report no packet speed if nothing was read for timeout seconds,
+        the reader thread and the hub do this on their poll timeouts.
+        """
+        if self.running and time.time() - self.last_read > timeout:
+            self.packet_speed = 0.0
+
+
+    def loop_readable(self):
+        """
+        Event loop callback, detaches the device if it fails.
+        """
+        try:
+            self.handle_readable(self.loop_file)
+        except (IOError, OSError):
+            self.detach()
+
+
+    def stream(self, timeout = None):
+        """
+        Iterate over the received packets as they arrive from the packet
+        queue.  The iteration ends if no packet arrives within timeout
+        seconds (never if timeout is None).  This blocks, so it is meant
+        for consumer threads, event loop code uses read_available().
+        """
+        while True:
+            try:
+                packet = self.packet_queue.get(timeout = timeout)
+            except Queue.Empty:
+                return
+            self.packet_queue.task_done()
+            yield packet
+
+
+    def read_batch(self, n, timeout = None):
+        """
+        Wait for the next n packets and return them as a list, which is
+        shorter if no packet arrives within timeout seconds.  This blocks,
+        so it is meant for consumer threads like stream().
+        """
+        batch = []
+        for packet in self.stream(timeout):
+            batch.append(packet)
+            if len(batch) == n:
+                break
+        return batch
+
+
+    def read_available(self, max_n = None):
+        """
+        Return the packets already in the packet queue as a list (at most
+        max_n of them) without waiting, so it can be called from the
+        event loop.
+        """
+        batch = []
+        while max_n is None or len(batch) < max_n:
+            try:
+                packet = self.packet_queue.get_nowait()
+            except Queue.Empty:
+                break
+            self.packet_queue.task_done()
+            batch.append(packet)
+        return batch
 
-        ts_buf = [ 0 ] * 128
-        ts_ndx = 0
 
+    def read_data(self):
+        """
+        Body of the reader thread: serve the device until stop is requested
+        or the device disappears.
+        """
         # open the device, if unsuccesfull, return immediately
+        f = None
         try:
-            f = open(self.in_dev_name, 'r')
+            f = self.open_device()
 
             # we're only running if the file opened succesfully
             self.running = True
@@ -115,38 +288,9 @@ class EmotivDevice:
                     self.packet_speed = 0.0
                     continue
 
-                # read 32 bytes from the device
-                enc_data = f.read(32)
-
-                # record the packet incoming time
-                ts_buf[ts_ndx] = time.time()
-                rd_ndx = (ts_ndx + 1) % 128
-                self.packet_speed = 128.0 / (ts_buf[ts_ndx] - ts_buf[rd_ndx])
-                ts_ndx = (ts_ndx + 1) % 128
-            
-                # decrypt the data using the AES cipher (two 16 byte blocks)
-                raw_data = self.aes.decrypt(enc_data[:16]) + self.aes.decrypt(enc_data[16:])
-
-                # enqueue the packet
-                packet = EmotivDataPacket(raw_data)
-                self.packet_queue.put(packet)
-
-                # forward the packet to subscribers
-                for sub_callback in self.subscribers:
-                    sub_callback(packet)
+                self.handle_readable(f)
 
-                # update the device state according to the packet
-                if packet.battery:
-                    self.battery = packet.battery
-
-                # update gyros
-                self.gyro_x, self.gyro_y = packet.gyro_x, packet.gyro_y
-
-                #  update contact quality information
-                if packet.cq_id is not None:
-                    self.cq[packet.cq_id] = packet.cq_val
-
-        except IOError as ioe:
+        except (IOError, OSError) as ioe:
 #            print("Error in Device reader thread: %s, terminating." % ioe)
 #            print(traceback.print_exc(ioe))
             pass
@@ -161,29 +305,125 @@ class EmotivDevice:
                 f.close()
 
 
+    def handle_readable(self, f):
+        """
+        Read, decrypt and process all frames the opened device f has ready.
+        Called by the reader thread (or an EmotivDeviceHub) whenever the
+        device is readable.
+        """
+        # read all frames the device has ready
+        enc_data = self.read_frames(f)
+
+        # decrypt the data using the AES cipher, ECB blocks are
+        # independent, so all frames are decrypted in one call
+        self.process_frames(self.aes.decrypt(enc_data), time.time())
+
+
+    def process_frames(self, raw_data, ts):
+        """
+        Process a run of decrypted frames which arrived at time ts.
+        """
+        self.last_read = ts
+
+        ts_buf = self.ts_buf
+        for i in range(0, len(raw_data), FRAME_SIZE):
+
+            # update the packet speed estimate
+            ts_buf[self.ts_ndx] = ts
+            self.ts_ndx = (self.ts_ndx + 1) % 128
+            if ts > ts_buf[self.ts_ndx]:
+                self.packet_speed = 128.0 / (ts - ts_buf[self.ts_ndx])
+
+            self.process_frame(raw_data[i:i+FRAME_SIZE])
+
+
+    def open_device(self):
+        """
+        Open the device node unbuffered in binary non-blocking mode and
+        allocate the read buffer, which holds up to max_batch frames.
+        """
+        fd = os.open(self.in_dev_name, os.O_RDONLY | os.O_NONBLOCK)
+        self.rd_buf = bytearray(FRAME_SIZE * self.max_batch)
+        self.rd_view = memoryview(self.rd_buf)
+        self.rd_fill = 0
+        self.reset_packet_speed()
+
+        return io.open(fd, 'rb', buffering = 0)
+
+
+    def reset_packet_speed(self):
+        """
+        Reset the packet arrival times for the packet speed estimate.
+        """
+        self.ts_buf = [ 0 ] * 128
+        self.ts_ndx = 0
+        self.last_read = 0.0
+
+
+    def read_frames(self, f):
+        """
+        Read all bytes the device has ready into the read buffer (until it
+        would block or the buffer is full) and return the complete frames
+        as one string of encrypted data.  An incomplete trailing frame is
+        kept at the beginning of the buffer for the next call.
+        """
+        start_fill = self.rd_fill
+        while self.rd_fill < len(self.rd_buf):
+            n = f.readinto(self.rd_view[self.rd_fill:])
+
+            # nothing more to read right now
+            if n is None:
+                break
+
+            # the device is readable but returns no data: end of stream
+            if n == 0:
+                if self.rd_fill == start_fill:
+                    raise IOError('end of stream on %s' % self.in_dev_name)
+                break
+
+            self.rd_fill += n
+
+        # split off the complete frames & move the rest to the front
+        complete = self.rd_fill - self.rd_fill % FRAME_SIZE
+        enc_data = self.rd_view[:complete].tobytes()
+        self.rd_buf[:self.rd_fill - complete] = self.rd_buf[complete:self.rd_fill]
+        self.rd_fill -= complete
+
+        return enc_data
+
+
+    def process_frame(self, raw_data):
+        """
+        Decode a single decrypted frame, enqueue the packet, forward it to
+        the subscribers and update the device state accordingly.
+        """
+        # pass the samples to the sample ring & enqueue the packet
+        packet = EmotivDataPacket(raw_data)
+        self.samples.push(packet.levels[:14])
+        if self.queue_packets:
+            self.packet_queue.put(packet)
+
+        # forward the packet to subscribers
+        for sub_callback in self.subscribers:
+            sub_callback(packet)
+
+        # update the device state according to the packet
+        if packet.battery:
+            self.battery = packet.battery
+
+        # update gyros
+        self.gyro_x, self.gyro_y = packet.gyro_x, packet.gyro_y
+
+        #  update contact quality information
+        if packet.cq_id is not None:
+            self.cq[packet.cq_id] = packet.cq_val
+
+
     def setup_aes_cipher(self, sn):
         """
-        This routine is again taken from emokit.py, specialized
-        for only the research headset and modified to use PyCrypto.
-        """
-        k = ['\0'] * 16
-        k[0] = sn[-1]
-        k[1] = '\0'
-        k[2] = sn[-2]
-        k[3] = 'T'
-        k[4] = sn[-3]
-        k[5] = '\x10'
-        k[6] = sn[-4]
-        k[7] = 'B'
-        k[8] = sn[-1]
-        k[9] = '\0'
-        k[10] = sn[-2]
-        k[11] = 'H'
-        k[12] = sn[-3]
-        k[13] = '\0'
-        k[14] = sn[-4]
-        k[15] = 'P'
-        self.aes = AES.new(string.join(k, ''), AES.MODE_ECB)
+        Setup the cipher decrypting the frames of the headset.
+        """
+        self.aes = make_aes_cipher(sn)
 
 
     def subscribe(self, tgt):
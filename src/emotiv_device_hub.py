@@ -0,0 +1,182 @@
+
+#
+#  This class serves any number of EmotivDevices from a single thread:
+#    - the device nodes of all registered devices are polled by one epoll loop
+#    - each readable device reads, decrypts and decodes its own frames
+#    - queues, subscribers and device state are handled by the devices
+#
+
+import select
+import threading
+import time
+import traceback
+
+
+class EmotivDeviceHub:
+    """
+    Reads data from several EmotivDevices on one thread instead of one
+    reader thread per device.  Each device keeps its own packet queue,
+    subscribers and state (battery, gyro, contact quality), exactly as
+    if it was served by its own reader thread.  Devices served by a hub
+    must not be started with start_reader(), stop_reader() removes them
+    from the hub.  A device which fails (including its subscribers) is
+    closed without affecting the others.
+    """
+
+    def __init__(self, timeout = 0.1):
+        """
+        Initialize the hub, timeout is the poll timeout in seconds after
+        which the stop request is checked.
+        """
+        self.timeout = timeout
+        self.epoll = select.epoll()
+        self.devices = {}
+        self.stop_requested = False
+        self.running = False
+        self.reader = None
+
+        # devices to be removed by the reader thread between polls
+        self.cond = threading.Condition()
+        self.removals = set()
+
+
+    def add_device(self, dev):
+        """
+        Open the device node of dev and start serving it.  May be called
+        while the hub is running.  Raises an IOError/OSError if the device
+        cannot be opened.
+        """
+        f = dev.open_device()
+        self.devices[f.fileno()] = (dev, f)
+        dev.running = True
+        dev.hub = self
+        self.epoll.register(f.fileno(), select.EPOLLIN)
+
+
+    def remove_device(self, dev):
+        """
+        Stop serving dev and close its device node.  While the hub is
+        running, the reader thread does this between polls and the call
+        waits for it (unless made on the reader thread itself, e.g. by a
+        subscriber).
+        """
+        with self.cond:
+            if self.running:
+                self.removals.add(dev)
+                if threading.current_thread() is self.reader:
+                    return
+                while dev in self.removals and self.running:
+                    self.cond.wait()
+
+            # the hub is not running (anymore), close the device here
+            self.removals.discard(dev)
+            for fd, (d, f) in self.devices.items():
+                if d is dev:
+                    self.close_device(fd)
+
+
+    def close_removed(self):
+        """
+        Close the devices queued by remove_device(), called by the reader
+        thread between polls.
+        """
+        with self.cond:
+            for fd, (d, f) in self.devices.items():
+                if d in self.removals:
+                    self.close_device(fd)
+            self.removals.clear()
+            self.cond.notify_all()
+
+
+    def close_device(self, fd):
+        """
+        Unregister and close the device node with the descriptor fd, if
+        it is still served.
+        """
+        entry = self.devices.pop(fd, None)
+        if entry is None:
+            return
+
+        dev, f = entry
+        self.epoll.unregister(fd)
+        f.close()
+        dev.running = False
+        dev.hub = None
+        dev.packet_speed = 0.0
+
+
+    def start(self):
+        """
+        Start the reader thread.
+        """
+        # if already started, return immediately
+        if self.running:
+            return
+
+        self.running = True
+        self.reader = threading.Thread(target = self.read_data)
+        self.reader.start()
+
+
+    def stop(self):
+        """
+        Stop the reader thread, the devices remain registered.
+        """
+        if not self.running:
+            return
+
+        # request stop & wait for the reader thread to join
+        self.stop_requested = True
+        self.reader.join()
+        self.reader = None
+
+
+    def close(self):
+        """
+        Stop the reader thread and close all device nodes.
+        """
+        self.stop()
+        with self.cond:
+            for fd in self.devices.keys():
+                self.close_device(fd)
+        self.epoll.close()
+
+
+    def read_data(self):
+        """
+        Body of the reader thread: dispatch readable device nodes to
+        their devices until stop is requested.
+        """
+        try:
+            while not self.stop_requested:
+
+                for fd, event in self.epoll.poll(self.timeout):
+                    entry = self.devices.get(fd)
+                    if entry is None:
+                        continue
+
+                    # a device that fails (e.g. was unplugged) is dropped,
+                    # as is one whose subscribers fail
+                    dev, f = entry
+                    try:
+                        dev.handle_readable(f)
+                    except (IOError, OSError):
+                        self.close_device(fd)
+                    except Exception:
+                        traceback.print_exc()
+                        self.close_device(fd)
+
+                self.close_removed()
+
+                # devices without data for a whole timeout report no speed
+                now = time.time()
+                for dev, f in self.devices.values():
+                    if now - dev.last_read > self.timeout:
+                        dev.packet_speed = 0.0
+
+        finally:
+            # reset flags & let waiting removals close their devices
+            with self.cond:
+                self.running = False
+                self.stop_requested = False
+                self.cond.notify_all()
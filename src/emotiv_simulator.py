@@ -0,0 +1,155 @@
+
+#
+#  Simulates research headsets by writing realistic encrypted frames into
+#  named pipes.  Pointing the in_dev_name of an EmotivDevice at such a pipe
+#  exercises the real read/decrypt/decode path without any hardware:
+#    - the counter runs 0..127 followed by a battery packet
+#    - packets 0 to 13 carry the contact quality of their channel
+#    - the gyros wobble around their rest position
+#    - the EEG is a configurable mix of sines and noise on a baseline
+#
+#  usage: emotiv_simulator.py [options] serial_num:fifo [serial_num:fifo ...]
+#
+
+import os
+import sys
+import time
+import errno
+import argparse
+import threading
+
+import numpy as np
+
+from emotiv_device import make_aes_cipher
+from emotiv_data_packet import encode_frames
+
+
+class EmotivSimulator:
+    """
+    Generates the encrypted frame stream of one research headset.
+    """
+
+    def __init__(self, serial_num, sines = ((10.0, 20.0),), noise = 5.0,
+                 baseline = 8200, battery = 0.8, sample_rate = 128):
+        """
+        Initialize the simulator for the headset serial_num.  The EEG of
+        every channel is the sum of the sines given as (frequency [Hz],
+        amplitude [uV]) pairs with gaussian noise of noise uV on top of the
+        baseline level.  The battery level is in [0..1].
+        """
+        self.aes = make_aes_cipher(serial_num)
+        self.sines = sines
+        self.noise = noise
+        self.baseline = baseline
+        self.battery_byte = int(225 + battery * (248 - 225))
+        self.sample_rate = sample_rate
+        self.sample_ndx = 0
+
+        # each channel gets its own phase & slightly different CQ
+        self.phases = np.random.uniform(0, 2 * np.pi, size = (14,))
+        self.cq = np.random.randint(900, 1100, size = (14,))
+
+
+    def frames(self, n):
+        """
+        Generate the next n encrypted frames as one string.
+        """
+        ndx = np.arange(self.sample_ndx, self.sample_ndx + n)
+        self.sample_ndx += n
+
+        # the counter cycle is 0..127 followed by the battery packet
+        counter = ndx % 129
+        counter[counter == 128] = self.battery_byte
+
+        # EEG levels (0.51 uV per LSB) & the CQ of packets 0..13
+        tm = ndx[:, np.newaxis] / float(self.sample_rate)
+        uv = np.random.normal(0.0, self.noise, size = (n, 14))
+        for freq, amp in self.sines:
+            uv += amp * np.sin(2 * np.pi * freq * tm + self.phases)
+        levels = np.zeros((n, 15), dtype = np.int)
+        levels[:, :14] = np.clip(self.baseline + uv / 0.51, 0, 2**14 - 1)
+        cq_frames = counter < 14
+        levels[cq_frames, 14] = self.cq[counter[cq_frames]]
+
+        # gyros wobble around their rest position
+        gyro_x = 105 + np.random.randint(-1, 2, size = (n,))
+        gyro_y = 105 + np.random.randint(-1, 2, size = (n,))
+
+        return self.aes.encrypt(encode_frames(counter, gyro_x, gyro_y, levels))
+
+
+    def run(self, fifo, speed = 1.0, duration = None, chunk = 4):
+        """
+        Write frames into the named pipe fifo (created if it does not
+        exist) at speed times the sample rate (as fast as possible if speed
+        is None) in chunks of chunk frames.  Runs for duration seconds of
+        simulated data or until the reader closes the pipe.
+        """
+        if not os.path.exists(fifo):
+            os.mkfifo(fifo)
+
+        # opening blocks until the reader opens the pipe
+        f = open(fifo, 'wb', 0)
+        try:
+            rate = self.sample_rate * (speed or 0.0)
+            total = None if duration is None else int(duration * self.sample_rate)
+            written = 0
+            t0 = time.time()
+            while total is None or written < total:
+                n = chunk if total is None else min(chunk, total - written)
+                f.write(self.frames(n))
+                written += n
+
+                # wait until the next chunk is due
+                if rate > 0:
+                    delay = t0 + written / rate - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+
+        except IOError as ioe:
+            # the reader went away
+            if ioe.errno != errno.EPIPE:
+                raise
+
+        finally:
+            try:
+                f.close()
+            except IOError:
+                pass
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description = 'Simulate Emotiv research headsets on named pipes.')
+    parser.add_argument('headsets', nargs = '+', metavar = 'serial_num:fifo',
+                        help = 'serial number of a simulated headset and its pipe')
+    parser.add_argument('-s', '--speed', type = float, default = 1.0,
+                        help = 'multiple of the 128Hz sample rate, 0 = as fast as possible')
+    parser.add_argument('-d', '--duration', type = float, default = None,
+                        help = 'seconds of data to generate (default: until the reader quits)')
+    parser.add_argument('-f', '--freq', type = float, default = 10.0,
+                        help = 'frequency of the EEG sine [Hz]')
+    parser.add_argument('-a', '--amplitude', type = float, default = 20.0,
+                        help = 'amplitude of the EEG sine [uV]')
+    parser.add_argument('-n', '--noise', type = float, default = 5.0,
+                        help = 'standard deviation of the EEG noise [uV]')
+    args = parser.parse_args()
+
+    # one writer thread per simulated headset
+    writers = []
+    for hs in args.headsets:
+        serial_num, fifo = hs.split(':', 1)
+        sim = EmotivSimulator(serial_num, ((args.freq, args.amplitude),), args.noise)
+        writers.append(threading.Thread(target = sim.run,
+                                        args = (fifo, args.speed or None, args.duration)))
+
+    for w in writers:
+        w.daemon = True
+        w.start()
+
+    # wait in short steps so that Ctrl+C is handled
+    try:
+        while any(w.is_alive() for w in writers):
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,60 @@
+
+#
+#  A bounded packet queue, which keeps the memory used by the acquired
+#  packets fixed if nobody pulls them.  What happens when the queue is
+#  full is decided by its overflow policy.
+#
+
+import Queue
+
+
+# overflow policies
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+BLOCK = 'block'
+
+
+class PacketQueue(Queue.Queue):
+    """
+    Queue with a maximum depth and an overflow policy:
+      - DROP_OLDEST: the oldest queued packet is discarded to make room
+      - DROP_NEWEST: the incoming packet is discarded
+      - BLOCK: put() blocks until there is room (standard Queue behavior)
+    The number of discarded packets is counted in dropped.  A maxsize of 0
+    makes the queue unbounded.
+    """
+
+    def __init__(self, maxsize = 0, policy = DROP_OLDEST):
+        """
+        Initialize the queue with its maximum depth and overflow policy.
+        """
+        if policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError('unknown overflow policy %r' % policy)
+
+        Queue.Queue.__init__(self, maxsize)
+        self.policy = policy
+        self.dropped = 0
+
+
+    def put(self, item, block = True, timeout = None):
+        """
+        Put the item into the queue, applying the overflow policy if the
+        queue is full.
+        """
+        if self.policy == BLOCK:
+            Queue.Queue.put(self, item, block, timeout)
+            return
+
+        with self.mutex:
+            if 0 < self.maxsize <= self._qsize():
+                self.dropped += 1
+                if self.policy == DROP_NEWEST:
+                    return
+
+                # the discarded item counts as a finished task
+                self._get()
+                self.unfinished_tasks -= 1
+
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
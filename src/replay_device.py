@@ -0,0 +1,90 @@
+
+#
+#  This class plays a recorded session through the EmotivDevice interface
+#  so that the whole pipeline (buffers, subscribers, GUI) can be run and
+#  load-tested without a headset:
+#    - the records are re-encoded into frames and processed exactly as
+#      decrypted frames read from the device
+#    - the replay runs at real time, any multiple of it or as fast as
+#      possible
+#
+
+import time
+
+import numpy as np
+
+from emotiv_device import EmotivDevice
+from emotiv_data_packet import encode_frames
+from signal_file import SignalFileReader
+
+
+class ReplayEmotivDevice(EmotivDevice):
+    """
+    An EmotivDevice fed from a recording made by the SignalWriter instead
+    of the /dev/eeg/encrypted device.  The packet queue, sample ring,
+    subscribers and device state behave as with a real headset.
+    """
+
+    def __init__(self, fname, speed = 1.0, loop = False, **kwds):
+        """
+        Open the recording fname, which is replayed at speed times the
+        recorded sample rate (as fast as possible if speed is None) and
+        restarted at its end if loop is set.  The other arguments are
+        passed to the EmotivDevice.
+        """
+        self.recording = SignalFileReader(fname)
+        self.speed = speed
+        self.loop = loop
+        EmotivDevice.__init__(self, self.recording.serial_num, fname, **kwds)
+
+
+    def setup_aes_cipher(self, sn):
+        """
+        The recorded packets are not encrypted.
+        """
+        self.aes = None
+
+
+    def read_data(self):
+        """
+        Body of the reader thread: process the recorded packets as they
+        become due until stop is requested or the recording ends.
+        """
+        recs = self.recording.records
+        rate = self.recording.sample_rate * (self.speed or 0.0)
+
+        self.reset_packet_speed()
+        self.running = True
+        try:
+            pos = 0
+            t0 = time.time()
+            while not self.stop_requested:
+
+                # the end of the recording
+                if pos == len(recs):
+                    if not self.loop or pos == 0:
+                        break
+                    pos = 0
+                    t0 = time.time()
+
+                # find the packets which are due, wait if there are none
+                if rate > 0:
+                    due = min(int((time.time() - t0) * rate) + 1, len(recs))
+                    if due <= pos:
+                        time.sleep(min((pos - due + 1) / rate, 0.1))
+                        continue
+                else:
+                    due = len(recs)
+                end = min(due, pos + self.max_batch)
+
+                r = recs[pos:end]
+                levels = np.column_stack((r['eeg'], np.maximum(r['cq'], 0)))
+                raw_data = encode_frames(r['counter'], r['gyro_x'], r['gyro_y'], levels)
+                self.process_frames(raw_data, time.time())
+                pos = end
+
+        finally:
+            # reset flags
+            self.running = False
+            self.stop_requested = False
+            self.packet_speed = 0.0
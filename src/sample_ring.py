@@ -0,0 +1,81 @@
+
+#
+#  A lock-free ring of sample rows connecting the reader thread (single
+#  producer) with the consumer pulling the samples into its buffer
+#  (single consumer).
+#
+
+import numpy as np
+
+
+class SampleRing:
+    """
+    Single-producer/single-consumer ring of preallocated sample rows.  The
+    producer only ever advances head and the consumer only ever advances
+    tail, both count rows since creation.  A row is always stored before
+    head is advanced past it, so the consumer never sees a partially
+    written row.  Assigning the indices is atomic in CPython, no locks are
+    needed.  If the ring is full, new rows are discarded and counted in
+    dropped (the producer must not move tail).
+    """
+
+    def __init__(self, capacity, row_len, dtype = np.float):
+        """
+        Allocate the ring with room for capacity rows of row_len values.
+        """
+        self.rows = np.zeros((capacity, row_len), dtype = dtype)
+        self.capacity = capacity
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+
+
+    def pending(self):
+        """
+        Number of rows available to the consumer.
+        """
+        return self.head - self.tail
+
+
+    def push(self, row):
+        """
+        Append a row (producer side).  Returns False if the ring is full
+        and the row was discarded.
+        """
+        head = self.head
+        if head - self.tail >= self.capacity:
+            self.dropped += 1
+            return False
+
+        self.rows[head % self.capacity, :] = row
+
+        # publish the row only after it was written
+        self.head = head + 1
+        return True
+
+
+    def drain_into(self, out):
+        """
+        Copy all pending rows (at most out.shape[0]) into the beginning of
+        out (consumer side) using at most two slice copies.  Returns the
+        number of copied rows.
+        """
+        tail = self.tail
+        n = min(self.head - tail, out.shape[0])
+
+        # copy up to the end of the ring, then wrap to its beginning
+        start = tail % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first, :] = self.rows[start:start+first, :]
+        out[first:n, :] = self.rows[:n-first, :]
+
+        # release the rows only after they were copied
+        self.tail = tail + n
+        return n
+
+
+    def clear(self):
+        """
+        Discard all pending rows (consumer side).
+        """
+        self.tail = self.head
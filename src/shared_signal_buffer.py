@@ -0,0 +1,151 @@
+
+#
+# A SignalBuffer living in a memory-mapped file (by default in /dev/shm),
+# so that other processes can attach to it read-only and access the
+# acquired data without any serialization or copying through pipes.
+#
+
+import os
+import mmap
+
+import numpy as np
+
+from signal_buffer import SignalBuffer
+from emotiv_data_packet import counter_to_sensor_id
+
+
+# the header occupies the first page of the file, the data follows
+HEADER_SIZE = 4096
+HEADER_MAGIC = 'WRSIGBUF'
+HEADER_VERSION = 1
+
+header_dtype = np.dtype([ ('magic', 'S8'),
+                          ('version', '<i8'),
+                          ('buf_len', '<i8'),
+                          ('capacity', '<i8'),
+                          ('sig_cnt', '<i8'),
+                          ('dtype', 'S8'),
+                          ('total', '<i8'),
+                          ('reserved', '<i8'),
+                          ('epoch', '<i8'),
+                          ('channels', 'S1024') ])
+
+
+class SharedSignalBuffer(SignalBuffer):
+    """
+    SignalBuffer whose double-length ring and write state (total, reserved
+    and epoch) are stored in a memory-mapped file.  The header holds the
+    buffer layout and the channel names, so that attach() can map the same
+    ring read-only in any other process and use window(), reader() and
+    buffer() exactly as the writing process does.
+    """
+
+    def __init__(self, path, buf_len, sig_cnt, slack = 0, dtype = np.float, channels = None):
+        """
+        Create the file at path (e.g. in /dev/shm) and initialize the
+        buffer in it.  Any existing file is replaced.
+        """
+        self.path = path
+        self.channels = channels or counter_to_sensor_id[:sig_cnt]
+        self.mm = None
+        self.header = None
+        self.owner = True
+        SignalBuffer.__init__(self, buf_len, sig_cnt, slack, dtype)
+
+
+    @classmethod
+    def attach(cls, path):
+        """
+        Map an existing shared buffer read-only.
+        """
+        f = open(path, 'rb')
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        finally:
+            f.close()
+
+        header = np.frombuffer(mm, dtype = header_dtype, count = 1)
+        if header['magic'][0] != HEADER_MAGIC or header['version'][0] != HEADER_VERSION:
+            raise IOError('%s is not a shared signal buffer' % path)
+
+        sb = cls.__new__(cls)
+        sb.path = path
+        sb.mm = mm
+        sb.header = header
+        sb.owner = False
+        sb.sinks = []
+        sb.stats = None
+        sb.buf_len = int(header['buf_len'][0])
+        sb.capacity = int(header['capacity'][0])
+        sb.sig_cnt = int(header['sig_cnt'][0])
+        sb.channels = header['channels'][0].split(',')
+        sb.buf = np.frombuffer(mm, dtype = np.dtype(header['dtype'][0]),
+                               count = sb.capacity * 2 * sb.sig_cnt,
+                               offset = HEADER_SIZE).reshape((sb.capacity * 2, sb.sig_cnt))
+        return sb
+
+
+    def allocate(self, shape, dtype):
+        """
+        Create the file, map it and write the header.
+        """
+        dtype = np.dtype(dtype)
+        size = HEADER_SIZE + shape[0] * shape[1] * dtype.itemsize
+
+        f = open(self.path, 'w+b')
+        try:
+            f.truncate(size)
+            self.mm = mmap.mmap(f.fileno(), size)
+        finally:
+            f.close()
+
+        self.header = np.frombuffer(self.mm, dtype = header_dtype, count = 1)
+        self.header['magic'] = HEADER_MAGIC
+        self.header['version'] = HEADER_VERSION
+        self.header['buf_len'] = self.buf_len
+        self.header['capacity'] = self.capacity
+        self.header['sig_cnt'] = shape[1]
+        self.header['dtype'] = dtype.str
+        self.header['channels'] = ','.join(self.channels)
+
+        return np.frombuffer(self.mm, dtype = dtype, count = shape[0] * shape[1],
+                             offset = HEADER_SIZE).reshape(shape)
+
+
+    # the write state is kept in the header, so that it is visible to
+    # the attached processes
+    def get_total(self):
+        return int(self.header['total'][0])
+
+    def set_total(self, total):
+        self.header['total'] = total
+
+    total = property(get_total, set_total)
+
+    def get_reserved(self):
+        return int(self.header['reserved'][0])
+
+    def set_reserved(self, reserved):
+        self.header['reserved'] = reserved
+
+    reserved = property(get_reserved, set_reserved)
+
+    def get_epoch(self):
+        return int(self.header['epoch'][0])
+
+    def set_epoch(self, epoch):
+        self.header['epoch'] = epoch
+
+    epoch = property(get_epoch, set_epoch)
+
+
+    def close(self):
+        """
+        Unmap the buffer, the creating process also removes the file.
+        """
+        self.buf = None
+        self.header = None
+        self.mm.close()
+        self.mm = None
+        if self.owner:
+            os.remove(self.path)
@@ -5,91 +5,405 @@
 # view of the current acquired EEG data.
 #
 
+import collections
+
 import numpy as np
 
 from emotiv_data_packet import EmotivDataPacket
 from emotiv_device import EmotivDevice
 
 
-class SignalBuffer:
+class SignalWindow:
+    """
+    A zero-copy window into a SignalBuffer: data is a view of the samples
+    with absolute indices start to start + len(data) - 1, acquired in the
+    given buffer epoch.  The view stays valid until the writer wraps
+    around over it or the buffer is cleared, which valid() checks.
+    Consumers should call valid() after they have used the data.
+    """
+
+    def __init__(self, sig_buf, data, start, epoch):
+        self.sig_buf = sig_buf
+        self.data = data
+        self.start = start
+        self.epoch = epoch
+
+
+    def end(self):
+        """
+        Absolute index one past the last sample in the window.
+        """
+        return self.start + self.data.shape[0]
+
+
+    def valid(self):
+        """
+        Check that the samples in the window were not overwritten.
+        """
+        return self.sig_buf.window_valid(self)
+
+
+class BufferReader:
+    """
+    A cursor of one consumer of a SignalBuffer.  Any number of readers may
+    follow the same buffer, each one gets the samples it has not seen yet
+    as zero-copy windows.
+    """
+
+    def __init__(self, sig_buf):
+        """
+        Start reading at the current end of the buffer.
+        """
+        self.sig_buf = sig_buf
+        self.pos = sig_buf.total
+        self.epoch = sig_buf.epoch
+        self.lost = 0
+
+
+    def read(self):
+        """
+        Return a SignalWindow with the samples appended since the last
+        read.  Samples which were overwritten before they could be read
+        are skipped and counted in lost, a cleared buffer restarts the
+        reader at its current end.
+        """
+        sb = self.sig_buf
+        total, epoch = sb.total, sb.epoch
+
+        if epoch != self.epoch:
+            self.epoch = epoch
+            self.pos = total
+        elif total - self.pos > sb.capacity:
+            self.lost += total - self.pos - sb.capacity
+            self.pos = total - sb.capacity
+
+        win = sb.window(total - self.pos, total)
+        self.pos = total
+        return win
+
+
+class WindowStats:
+    """
+    Statistics of the last buf_len samples of each channel of a
+    SignalBuffer, maintained on append: running sums of the samples and of
+    their squares and a monotonic deque of (index, level) candidates for
+    the minimum and the maximum of each channel.  All queries are O(1).
+    """
+
+    def __init__(self, sig_buf, resync_every = 16):
+        """
+        Follow sig_buf, the sums are recomputed from the window every
+        resync_every buffer lengths to bound the rounding errors.
+        """
+        self.sig_buf = sig_buf
+        self.n = sig_buf.buf_len
+        self.resync_len = resync_every * self.n
+        self.reset()
+
+
+    def reset(self):
+        """
+        Recompute all statistics from the current window of the buffer.
+        """
+        sb = self.sig_buf
+        data = sb.buffer().astype(np.float64)
+        self.sum = np.sum(data, axis = 0)
+        self.sum_sq = np.sum(data ** 2, axis = 0)
+        self.since_reset = 0
+
+        self.min_cands = [ collections.deque() for i in range(sb.sig_cnt) ]
+        self.max_cands = [ collections.deque() for i in range(sb.sig_cnt) ]
+        self.push_extremes(data, sb.total - self.n)
+
+
+    def push_extremes(self, block, start):
+        """
+        Add the samples of block with absolute indices from start on to the
+        candidate deques and drop the candidates which left the window.  The
+        minimum candidates are kept negated so that both deques decrease.
+        """
+        if block.shape[0] == 0:
+            return
+        self.push_maxima(self.max_cands, block, start)
+        self.push_maxima(self.min_cands, -block, start)
+
+
+    def push_maxima(self, cand_list, block, start):
+        """
+        Push the block into the decreasing candidate deques (one per
+        channel) of the window maxima.
+        """
+        k, sig_cnt = block.shape
+        first = start + k - self.n
+
+        # only samples above all later samples of the block can become the
+        # maximum, the survivors are found for all channels at once
+        later_max = np.maximum.accumulate(block[::-1], axis = 0)[::-1]
+        mask = np.ones((sig_cnt, k), dtype = bool)
+        mask[:, :-1] = (block[:-1] > later_max[1:]).T
+
+        # survivors ordered by channel, each channel has at least one
+        chans, ndx = np.nonzero(mask)
+        vals = block.T[mask].tolist()
+        ndx = (ndx + start).tolist()
+        ends = np.cumsum(np.bincount(chans, minlength = sig_cnt)).tolist()
+
+        pos = 0
+        for cands, end in zip(cand_list, ends):
+
+            # the first survivor is the maximum of the block
+            v = vals[pos]
+            while cands and cands[-1][1] <= v:
+                cands.pop()
+            cands.extend(zip(ndx[pos:end], vals[pos:end]))
+            pos = end
+
+            while cands[0][0] < first:
+                cands.popleft()
+
+
+    def update(self, block, outgoing):
+        """
+        Account for the new block of samples (fewer than buf_len) and the
+        samples outgoing which leave the window.
+        """
+        new = block.astype(np.float64)
+        old = outgoing.astype(np.float64)
+        self.sum += np.sum(new, axis = 0) - np.sum(old, axis = 0)
+        self.sum_sq += np.sum(new ** 2, axis = 0) - np.sum(old ** 2, axis = 0)
+        self.push_extremes(new, self.sig_buf.total - block.shape[0])
+
+        self.since_reset += block.shape[0]
+        if self.since_reset >= self.resync_len:
+            self.reset()
+
+
+    def mean(self):
+        """
+        Per-channel mean of the window.
+        """
+        return self.sum / self.n
+
+
+    def rms(self):
+        """
+        Per-channel root mean square of the window.
+        """
+        return np.sqrt(np.maximum(self.sum_sq / self.n, 0.0))
+
+
+    def std(self):
+        """
+        Per-channel standard deviation of the window (the RMS of the
+        signal with its mean removed).
+        """
+        m = self.sum / self.n
+        return np.sqrt(np.maximum(self.sum_sq / self.n - m ** 2, 0.0))
+
+
+    def min(self):
+        """
+        Per-channel minimum of the window.
+        """
+        return -np.array([ cands[0][1] for cands in self.min_cands ])
+
+
+    def max(self):
+        """
+        Per-channel maximum of the window.
+        """
+        return np.array([ cands[0][1] for cands in self.max_cands ])
+
+
+    def peak_to_peak(self):
+        """
+        Per-channel range of the window, useful for artifact checks.
+        """
+        return self.max() - self.min()
+
+
+class SignalBuffer(object):
     """
     The buffer in this class is twice as big as what has to be available
     at any time from the device.  Through a suitable write strategy, the
     buffer will always contain a contiguous segment of available EEG data.
+
+    Sample number t is written both to row t % capacity and to its mirror
+    row t % capacity + capacity, so any run of up to capacity of the most
+    recent samples is a contiguous region.  The capacity is buf_len plus
+    slack samples, the slack keeps windows handed out to consumers valid
+    while the writer appends that many more samples.
+
+    A single writer appends samples (pull_packets), any number of consumers
+    may read windows or follow the buffer with a BufferReader.  Samples
+    have absolute indices (total is the number of samples appended) and
+    clear() starts a new epoch.
+
+    With track_stats, the mean, RMS, minimum and maximum of the buffer_len
+    window are available from stats (a WindowStats) at no per-query cost.
     """
 
 
-    def __init__(self, buf_len, sig_cnt):
+    def __init__(self, buf_len, sig_cnt, slack = 0, dtype = np.float, track_stats = False):
         """
-        Initialize the buffer, allocate memory.
+        Initialize the buffer, allocate memory.  The samples are stored as
+        dtype, np.uint16 or np.int16 hold the raw 14-bit levels exactly,
+        np.float32 is enough for processed data.  If track_stats is set,
+        the window statistics are maintained on append.
         """
-        self.buf = np.ones((buf_len * 2, sig_cnt), dtype = np.float) * 8000
         self.buf_len = buf_len
         self.sig_cnt = sig_cnt
-        self.valid_region_start = 0
-        self.valid_region_end = 0
+        self.capacity = buf_len + slack
+        self.buf = self.allocate((self.capacity * 2, sig_cnt), dtype)
+        self.buf[:] = 8000
+        self.total = 0
+        self.reserved = 0
+        self.epoch = 0
+        self.valid_region_start = self.capacity - buf_len
+        self.valid_region_end = self.capacity
+        self.sinks = []
+
+        # staging area for samples drained from the device
+        self.pull_buf = np.zeros((buf_len, sig_cnt), dtype = dtype)
+
+        self.stats = WindowStats(self) if track_stats else None
+
+
+    def allocate(self, shape, dtype):
+        """
+        Allocate the memory of the buffer.
+        """
+        return np.empty(shape, dtype = dtype)
 
 
     def buffer(self):
         """
         Access the region with data of len buf_len.  Part of the buffer
-        may be filled with zeros if not enough data has been acquired yet.
+        may be filled with the initial value if not enough data has been
+        acquired yet.
         """
-        start = self.valid_region_start
+        start = (self.total - self.buf_len) % self.capacity
         return self.buf[start:start+self.buf_len, :]
 
 
-    def pull_packets(self, dev):
+    def window(self, n = None, end = None):
         """
-        Pull all available packets from the packet queue in the device and
-        update the buffer.
+        Return a SignalWindow with the n samples (buf_len by default) up to
+        the absolute index end (the current end by default).  At most
+        capacity samples can be accessed.
+        """
+        n = self.buf_len if n is None else n
+        end = self.total if end is None else end
+        if n > self.capacity:
+            raise ValueError('window of %d samples exceeds capacity %d' % (n, self.capacity))
+
+        start = (end - n) % self.capacity
+        return SignalWindow(self, self.buf[start:start+n, :], end - n, self.epoch)
+
+
+    def window_valid(self, win):
+        """
+        Check if the window still holds the samples it was created with.
+        """
+        return win.epoch == self.epoch and self.reserved - win.start <= self.capacity
+
+
+    def reader(self):
+        """
+        Create a new BufferReader following this buffer.
+        """
+        return BufferReader(self)
+
+
+    def add_sink(self, sink):
+        """
+        Register a callable, which receives every block of samples
+        appended to the buffer (e.g. a SignalHistory.append).
         """
-        # get handles to current state
-        rend = self.valid_region_end
+        self.sinks.append(sink)
+
+
+    def remove_sink(self, sink):
+        """
+        Unregister a sink.
+        """
+        self.sinks.remove(sink)
+
+
+    def append(self, block):
+        """
+        Append a block of samples (k x sig_cnt) to the buffer.  The block
+        is written to the primary and mirror halves with at most four slice
+        assignments, two of them only if the write wraps around.
+        """
+        C = self.capacity
         buf = self.buf
-        N = self.buf_len
+        k = block.shape[0]
 
-        pulled = 0
-        while not dev.packet_queue.empty():
+        # the sinks get all the samples
+        for sink in self.sinks:
+            sink(block)
 
-            # extract packet from queue
-            packet = dev.packet_queue.get()
+        # only the last C samples of a long block can be kept
+        if k > C:
+            self.total += k - C
+            block = block[k-C:]
+            k = C
 
-            if rend < buf.shape[0] - 1:
+        # the samples leaving the window must be read before they are
+        # overwritten, a block of buf_len or more replaces the whole window
+        stats = self.stats
+        if stats is not None and k < self.buf_len:
+            outgoing = self.window(k, self.total - self.buf_len + k).data.copy()
 
-                # store at current write position
-                buf[rend, :] = packet.eeg
+        # announce the samples to be overwritten before writing
+        self.reserved = self.total + k
 
-                # if write position is past roll point write to beginning
-                # as well
-                if rend > self.buf_len:
-                    buf[rend - N, :] = packet.eeg
+        # write up to the end of the primary half, then wrap around
+        pos = self.total % C
+        first = min(k, C - pos)
+        buf[pos:pos+first, :] = block[:first]
+        buf[pos+C:pos+C+first, :] = block[:first]
+        buf[:k-first, :] = block[first:]
+        buf[C:C+k-first, :] = block[first:]
 
-                # move write position
-                rend += 1
+        # update the valid region
+        self.total += k
+        self.valid_region_start = (self.total - self.buf_len) % C
+        self.valid_region_end = self.valid_region_start + self.buf_len
 
+        if stats is not None:
+            if k < self.buf_len:
+                stats.update(block, outgoing)
             else:
+                stats.reset()
 
-                # we have passed the allocated memory end
-                # double writing strategy ensures we have history at beginning
-                # N - 1 values, now we write the last element
-                rend = N - 1
 
-                buf[rend, :] = packet.eeg
-                rend += 1
+    def pull_packets(self, dev):
+        """
+        Pull all available samples from the sample ring in the device and
+        update the buffer.
+        """
+        pulled = 0
+        while True:
 
-            dev.packet_queue.task_done()
-            pulled += 1
+            # copy pending samples out of the ring in blocks
+            k = dev.samples.drain_into(self.pull_buf)
+            if k == 0:
+                break
 
-        # update the start position
-        self.valid_region_end = rend
-        self.valid_region_start = max(0, rend - N)
+            self.append(self.pull_buf[:k])
+            pulled += k
 
         return pulled
 
 
     def clear(self):
         """
-        Used to clear the GUI from movements.
+        Used to clear the GUI from movements.  Starts a new epoch, which
+        invalidates all windows handed out so far.
         """
+        self.epoch += 1
         self.buf[:] = 0.0
+        if self.stats is not None:
+            self.stats.reset()
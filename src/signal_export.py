@@ -0,0 +1,39 @@
+
+#
+#  Exports a binary recording into a CSV file with one line per packet:
+#  counter, gyro X, gyro Y, 14 EEG levels and the CQ level (-1 if none).
+#
+#  usage: signal_export.py recording csv_file
+#
+
+import sys
+
+import numpy as np
+
+from signal_file import SignalFileReader
+
+
+def export_csv(in_fname, out_fname):
+    """
+    Convert the recording in_fname into the CSV file out_fname.
+    """
+    rd = SignalFileReader(in_fname)
+    recs = rd.records
+
+    data = np.empty((len(rd), 18), dtype = np.int)
+    data[:, 0] = rd.counter()
+    data[:, 1] = recs['gyro_x']
+    data[:, 2] = recs['gyro_y']
+    data[:, 3:17] = recs['eeg']
+    data[:, 17] = recs['cq']
+
+    np.savetxt(out_fname, data, fmt = '%d', delimiter = ', ')
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) != 3:
+        print("usage: %s recording csv_file" % sys.argv[0])
+        sys.exit(1)
+
+    export_csv(sys.argv[1], sys.argv[2])
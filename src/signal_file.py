@@ -0,0 +1,176 @@
+
+#
+#  The binary recording format of wave rider.  A recording consists of a
+#  fixed-size header followed by fixed-size little-endian records, one
+#  per packet:
+#
+#    header: magic, version, sample rate, channel count, record size,
+#            start time, serial number of the headset, channel names
+#    record: raw counter byte (values over 127 carry the battery level),
+#            gyro X, gyro Y, reserved byte, 14 EEG levels (int16),
+#            CQ level (int16, -1 if the packet carries none)
+#
+
+import time
+
+import numpy as np
+
+from emotiv_data_packet import counter_to_sensor_id
+
+
+FILE_MAGIC = 'WRSIGREC'
+FILE_VERSION = 1
+
+header_dtype = np.dtype([ ('magic', 'S8'),
+                          ('version', '<u2'),
+                          ('sample_rate', '<u2'),
+                          ('chan_cnt', '<u2'),
+                          ('record_size', '<u2'),
+                          ('start_time', '<f8'),
+                          ('serial_num', 'S32'),
+                          ('channels', 'S64'),
+                          ('reserved', 'S8') ])
+
+record_dtype = np.dtype([ ('counter', 'u1'),
+                          ('gyro_x', 'u1'),
+                          ('gyro_y', 'u1'),
+                          ('reserved', 'u1'),
+                          ('eeg', '<i2', (14,)),
+                          ('cq', '<i2') ])
+
+HEADER_SIZE = header_dtype.itemsize
+RECORD_SIZE = record_dtype.itemsize
+
+
+def make_header(serial_num, start_time = None, sample_rate = 128):
+    """
+    Build the header of a new recording, returns it as a string.
+    """
+    hdr = np.zeros((1,), dtype = header_dtype)
+    hdr['magic'] = FILE_MAGIC
+    hdr['version'] = FILE_VERSION
+    hdr['sample_rate'] = sample_rate
+    hdr['chan_cnt'] = len(counter_to_sensor_id)
+    hdr['record_size'] = RECORD_SIZE
+    hdr['start_time'] = time.time() if start_time is None else start_time
+    hdr['serial_num'] = serial_num
+    hdr['channels'] = ','.join(counter_to_sensor_id)
+    return hdr.tostring()
+
+
+def pack_record(p):
+    """
+    Pack an EmotivDataPacket into a record string.
+    """
+    levels = p.levels.astype('<i2')
+    if p.counter >= 14:
+        levels[14] = -1
+    return p.raw[0] + p.raw[29:31] + '\0' + levels.tostring()
+
+
+class SignalFileReader:
+    """
+    Reads a recording made by the SignalWriter.  The records are memory
+    mapped, so opening even a multi-hour recording is instant and only
+    the accessed parts of the file are read.
+    """
+
+    def __init__(self, fname):
+        """
+        Open the recording, read its header & map its records.
+        """
+        self.fname = fname
+        with open(fname, 'rb') as f:
+            hdr = np.fromfile(f, dtype = header_dtype, count = 1)
+            if len(hdr) != 1 or hdr['magic'][0] != FILE_MAGIC:
+                raise IOError('%s is not a wave rider recording' % fname)
+            if hdr['version'][0] != FILE_VERSION or hdr['record_size'][0] != RECORD_SIZE:
+                raise IOError('unsupported recording version in %s' % fname)
+
+            # an incomplete trailing record (e.g. after a crash) is ignored
+            f.seek(0, 2)
+            n = (f.tell() - HEADER_SIZE) // RECORD_SIZE
+
+        if n > 0:
+            self.records = np.memmap(fname, dtype = record_dtype, mode = 'r',
+                                     offset = HEADER_SIZE, shape = (n,))
+        else:
+            self.records = np.zeros((0,), dtype = record_dtype)
+
+        self.sample_rate = int(hdr['sample_rate'][0])
+        self.start_time = float(hdr['start_time'][0])
+        self.serial_num = hdr['serial_num'][0]
+        self.channels = hdr['channels'][0].split(',')
+        self.resets = None
+
+
+    def __len__(self):
+        return self.records.shape[0]
+
+
+    def eeg(self):
+        """
+        The EEG levels (N x 14) as a lazy view of the file.
+        """
+        return self.records['eeg']
+
+
+    def window(self, start, n):
+        """
+        The EEG levels of n samples starting at sample index start, only
+        this part of the file is read when the data is accessed.
+        """
+        return self.records['eeg'][start:start+n]
+
+
+    def index_at(self, t):
+        """
+        Sample index of the absolute time t (as given by time.time()),
+        clipped to the recording.
+        """
+        ndx = int((t - self.start_time) * self.sample_rate)
+        return max(0, min(len(self), ndx))
+
+
+    def time_at(self, ndx):
+        """
+        Absolute time of the sample with index ndx.
+        """
+        return self.start_time + float(ndx) / self.sample_rate
+
+
+    def counter(self):
+        """
+        The packet counters, 128 for battery packets.
+        """
+        counter = self.records['counter']
+        return np.where(counter > 127, 128, counter)
+
+
+    def battery(self):
+        """
+        The battery levels, NaN for packets which carry none.
+        """
+        counter = self.records['counter'].astype(np.float)
+        return np.where(counter > 127, np.clip((counter - 225.0) / (248.0 - 225.0), 0.0, 1.0), np.nan)
+
+
+    def counter_resets(self, block = 128 * 60 * 10):
+        """
+        Sparse index of the samples which do not continue the counter
+        sequence of their predecessor (0..127, battery packet, 0, ...):
+        the regular wraps to 0 and the places where packets were lost.
+        The index is built on first use, scanning the file in blocks.
+        """
+        if self.resets is not None:
+            return self.resets
+
+        resets = [ np.array([0], dtype = np.int) ] if len(self) > 0 else []
+        for start in range(0, len(self), block):
+            c = self.records['counter'][start:start+block+1].astype(np.int)
+            c[c > 127] = 128
+            breaks = np.flatnonzero(c[1:] != c[:-1] + 1) + start + 1
+            resets.append(breaks)
+
+        self.resets = np.concatenate(resets) if resets else np.zeros((0,), dtype = np.int)
+        return self.resets
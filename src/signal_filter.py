@@ -0,0 +1,101 @@
+
+#
+#  Real-time filtering of the EEG levels.  A RealTimeFilter is a sink of a
+#  raw SignalBuffer, every appended block is filtered once by a cascade of
+#    - a DC removing highpass
+#    - a 50/60Hz notch
+#    - a configurable bandpass
+#  merged into one second order sections filter with per-channel state and
+#  the result is appended to a parallel float32 SignalBuffer (output).
+#
+
+import numpy as np
+import scipy.signal
+
+from signal_buffer import SignalBuffer
+
+
+def design_filter(sample_rate = 128.0, dc_cutoff = 0.16, notch = 50.0, notch_q = 30.0,
+                  band = (1.0, 40.0), band_order = 4):
+    """
+    Design the cascade as second order sections, any stage given as None
+    is left out.
+    """
+    nyq = sample_rate / 2.0
+    stages = []
+
+    if dc_cutoff is not None:
+        stages.append(scipy.signal.butter(1, dc_cutoff / nyq, 'highpass', output = 'sos'))
+
+    if notch is not None:
+        b, a = scipy.signal.iirnotch(notch / nyq, notch_q)
+        stages.append(scipy.signal.tf2sos(b, a))
+
+    if band is not None:
+        stages.append(scipy.signal.butter(band_order, [ band[0] / nyq, band[1] / nyq ],
+                                          'bandpass', output = 'sos'))
+
+    if not stages:
+        raise ValueError('the filter has no stages')
+
+    return np.vstack(stages)
+
+
+class RealTimeFilter:
+    """
+    Filters the blocks appended to a SignalBuffer into the output buffer.
+    """
+
+    def __init__(self, sig_buf, sample_rate = 128.0, dc_cutoff = 0.16, notch = 50.0,
+                 notch_q = 30.0, band = (1.0, 40.0), band_order = 4):
+        """
+        Attach the filter to sig_buf, the output buffer has the same length
+        and slack and tracks statistics if sig_buf does.  See design_filter
+        for the filter parameters, notch is the mains frequency (50 or
+        60Hz).
+        """
+        self.sig_buf = sig_buf
+        self.sos = design_filter(sample_rate, dc_cutoff, notch, notch_q, band, band_order)
+        self.zi = None
+
+        self.output = SignalBuffer(sig_buf.buf_len, sig_buf.sig_cnt,
+                                   slack = sig_buf.capacity - sig_buf.buf_len,
+                                   dtype = np.float32,
+                                   track_stats = sig_buf.stats is not None)
+        self.output.clear()
+
+        sig_buf.add_sink(self.process)
+
+
+    def process(self, block):
+        """
+        Filter a block of samples (samples x channels) and append it to the
+        output buffer.
+        """
+        if block.shape[0] == 0:
+            return
+
+        x = block.astype(np.float64)
+
+        # start in the steady state of the first sample to avoid the step
+        # response of the DC level
+        if self.zi is None:
+            self.zi = scipy.signal.sosfilt_zi(self.sos)[:, :, np.newaxis] * x[0]
+
+        y, self.zi = scipy.signal.sosfilt(self.sos, x, axis = 0, zi = self.zi)
+        self.output.append(y)
+
+
+    def clear(self):
+        """
+        Reset the filter state and clear the output buffer.
+        """
+        self.zi = None
+        self.output.clear()
+
+
+    def close(self):
+        """
+        Detach the filter from its signal buffer.
+        """
+        self.sig_buf.remove_sink(self.process)
@@ -0,0 +1,139 @@
+
+#
+# This implements a multi-resolution history of the acquired signals for
+# zoomed-out views.  Besides the raw samples kept by the SignalBuffer, the
+# history keeps min/max decimated levels which are updated incrementally
+# as samples are appended, so the cost of drawing a long time span does
+# not grow with its length.
+#
+
+import numpy as np
+
+from signal_buffer import SignalBuffer
+
+
+class HistoryLevel:
+    """
+    One decimated level of the history: each entry holds the minimum and
+    maximum of factor raw samples per signal.  The entries are stored in
+    two SignalBuffers, so that the most recent ones are always contiguous.
+    """
+
+    def __init__(self, factor, ratio, length, sig_cnt, dtype):
+        """
+        Initialize a level with entries covering factor raw samples, each
+        made from ratio input entries (of the previous level or raw
+        samples), keeping length entries.
+        """
+        self.factor = factor
+        self.ratio = ratio
+        self.mins = SignalBuffer(length, sig_cnt, dtype = dtype)
+        self.maxs = SignalBuffer(length, sig_cnt, dtype = dtype)
+
+        # the bucket which is being filled
+        self.pend_min = np.zeros((sig_cnt,), dtype = dtype)
+        self.pend_max = np.zeros((sig_cnt,), dtype = dtype)
+        self.pend_cnt = 0
+
+
+    def push(self, mins, maxs):
+        """
+        Merge k input entries (k x sig_cnt minima & maxima) into the level.
+        Returns the completed entries as (minima, maxima), which are the
+        input of the next level.
+        """
+        r = self.ratio
+        k = mins.shape[0]
+        if k == 0:
+            return None, None
+        done_min, done_max = [], []
+
+        # complete the pending bucket first
+        i = 0
+        if self.pend_cnt > 0:
+            i = min(r - self.pend_cnt, k)
+            self.pend_min = np.minimum(self.pend_min, mins[:i].min(axis = 0))
+            self.pend_max = np.maximum(self.pend_max, maxs[:i].max(axis = 0))
+            self.pend_cnt += i
+            if self.pend_cnt == r:
+                done_min.append(self.pend_min[np.newaxis, :])
+                done_max.append(self.pend_max[np.newaxis, :])
+                self.pend_cnt = 0
+
+        # reduce all complete buckets in one go
+        full = (k - i) // r
+        if full > 0:
+            j = i + full * r
+            done_min.append(mins[i:j].reshape((full, r, -1)).min(axis = 1))
+            done_max.append(maxs[i:j].reshape((full, r, -1)).max(axis = 1))
+            i = j
+
+        # start a new pending bucket with the rest
+        if i < k:
+            self.pend_min = mins[i:].min(axis = 0)
+            self.pend_max = maxs[i:].max(axis = 0)
+            self.pend_cnt = k - i
+
+        if len(done_min) == 0:
+            return None, None
+
+        done_min = np.concatenate(done_min)
+        done_max = np.concatenate(done_max)
+        self.mins.append(done_min)
+        self.maxs.append(done_max)
+        return done_min, done_max
+
+
+    def envelope(self, n):
+        """
+        Return the minima & maxima of the last n entries (at most the
+        length of the level).
+        """
+        n = min(n, self.mins.capacity)
+        return self.mins.window(n).data, self.maxs.window(n).data
+
+
+class SignalHistory:
+    """
+    A set of min/max decimated levels of the signal, e.g. with factors 8,
+    64 and 512 and the default length of 1024 entries the levels cover 64
+    seconds, 8.5 minutes and 68 minutes of data at 128Hz.  The history is
+    fed with appended samples by SignalBuffer.add_sink().
+    """
+
+    def __init__(self, sig_cnt, length = 1024, factors = (8, 64, 512), dtype = np.float32):
+        """
+        Initialize the levels, each factor must be a multiple of the
+        previous one.
+        """
+        self.levels = []
+        prev = 1
+        for f in factors:
+            self.levels.append(HistoryLevel(f, f // prev, length, sig_cnt, dtype))
+            prev = f
+
+
+    def append(self, block):
+        """
+        Update the levels with a block of raw samples (k x sig_cnt).
+        """
+        mins, maxs = block, block
+        for level in self.levels:
+            mins, maxs = level.push(mins, maxs)
+            if mins is None:
+                break
+
+
+    def level_for(self, span, pixels):
+        """
+        Select the finest level which can show span raw samples with at
+        most one entry per pixel and holds enough entries for the span.
+        Returns None if the raw samples fit into the pixels and the
+        coarsest level if no level is good enough.
+        """
+        if span <= pixels:
+            return None
+        for level in self.levels:
+            if span <= pixels * level.factor and span <= level.mins.capacity * level.factor:
+                return level
+        return self.levels[-1]
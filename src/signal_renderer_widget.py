@@ -9,16 +9,21 @@ import scipy.signal
 from albow.widget import Widget, overridable_property
 from albow.theme import ThemeProperty
 
+from spectral_engine import SlidingSpectrum
+
 
 class SignalRendererWidget(Widget):
 	
 	
-    def __init__(self, signal_list, dev, buf, rect, **kwds):
+    def __init__(self, signal_list, dev, buf, rect, history = None, filtered = None, **kwds):
         """
         Initialize the renderer with the signal_name to index mapping
         (always all 14 signals).  The measurement device, the signal
         buffer and the rectangle into which the signals are to be rendered.
-        To select shown signals, use select_channels.
+        To select shown signals, use select_channels.  If a SignalHistory
+        fed by the buffer is given, time spans longer than the buffer can
+        be shown (see set_span).  If a buffer with the filtered signals is
+        given, the display can be switched to it (see toggle_filtered).
         """
         Widget.__init__(self, rect, **kwds)
         self.sig_list = signal_list
@@ -29,6 +34,12 @@ class SignalRendererWidget(Widget):
         self.multiplier = 1.0
         self.selected = range(14)
         self.display_type = [0] * 14
+        self.history = history
+        self.span = buf.buf_len
+        self.filtered = filtered
+        self.show_filtered = False
+        self.spectrum = SlidingSpectrum(buf)
+        self.filtered_spectrum = SlidingSpectrum(filtered) if filtered is not None else None
 
 
     def select_channels(self, which):
@@ -54,6 +65,24 @@ class SignalRendererWidget(Widget):
             self.display_type[ndx] = 0
 
 
+    def set_span(self, span):
+        """
+        Set the shown time span in samples, spans longer than the signal
+        buffer require a history and are drawn from it (even if the
+        span would fit into the frame width).
+        """
+        if self.history is None:
+            span = min(span, self.buf.buf_len)
+        self.span = max(span, 1)
+
+
+    def toggle_filtered(self):
+        """
+        Switch between the raw and the filtered signals (if available).
+        """
+        self.show_filtered = self.filtered is not None and not self.show_filtered
+
+
     def update_magnification(self, update):
         """
         Set the magnification of the displayed signal.
@@ -61,9 +90,10 @@ class SignalRendererWidget(Widget):
         self.multiplier = max(0.2, self.multiplier + update)
 
     
-    def render_time_series(self, sig, color, frame, surf):
+    def render_time_series(self, sig, color, frame, surf, zero_lev = None):
         """
-        Render a time series representation (given by pts) into rect.
+        Render a time series representation (given by pts) into rect.  The
+        zero level is the mean of the signal unless given.
         """
 
         # draw the zero level
@@ -76,11 +106,8 @@ class SignalRendererWidget(Widget):
                          (frame.right, frame.bottom))
 
         # draw the signal onto the screen (remove mean in buffer)
-        zero_lev = np.mean(sig)
-        sig_amp = max(np.max(sig) - zero_lev, zero_lev - np.min(sig))
-        if sig_amp == 0:
-            sig_amp = 1.0
-#        pixel_per_lsb = self.multiplier * frame.height / sig_amp / 2.0
+        if zero_lev is None:
+            zero_lev = np.mean(sig)
         pixel_per_lsb = self.multiplier * frame.height / (200.0 / 0.51)
         draw_pts_y = zero_ax_y - (sig - zero_lev) * pixel_per_lsb
         draw_pts_y[draw_pts_y < frame.top] = frame.top
@@ -102,26 +129,38 @@ class SignalRendererWidget(Widget):
                          (frame.right - 10, zero_ax_y + uV10_len // 2), 2)
 
 
-    def render_spectrum(self, sig, color, frame, surf):
+    def render_envelope(self, mins, maxs, color, frame, surf):
         """
-        Render a spectral representation of the signal.
+        Render the min/max envelope of a decimated history level into rect,
+        each entry is drawn as a vertical stroke from its minimum to its
+        maximum.
         """
-        min_freq = 0.7
-        max_freq = 45.0
+        zero_ax_y = frame.top + frame.height // 2
+        pygame.draw.line(surf, (70, 70, 70),
+                         (frame.left, zero_ax_y),
+                         (frame.right, zero_ax_y))
+        pygame.draw.line(surf, (20, 60, 20, 30),
+                         (frame.left, frame.bottom),
+                         (frame.right, frame.bottom))
 
-        s2 = sig.copy()
+        # interleave the extremes so that one polyline draws all strokes
+        zero_lev = (np.mean(mins) + np.mean(maxs)) / 2.0
+        pixel_per_lsb = self.multiplier * frame.height / (200.0 / 0.51)
+        draw_pts_y = np.empty((2 * len(mins),))
+        draw_pts_y[0::2] = zero_ax_y - (maxs - zero_lev) * pixel_per_lsb
+        draw_pts_y[1::2] = zero_ax_y - (mins - zero_lev) * pixel_per_lsb
+        np.clip(draw_pts_y, frame.top, frame.bottom, out = draw_pts_y)
+        draw_pts_x = np.repeat(np.linspace(0, frame.width, len(mins)), 2) + frame.left
+
+        pygame.draw.lines(surf, color, False, zip(draw_pts_x, draw_pts_y))
 
-        # special check for all zeros (no data situation)
-        if np.all(s2 == 0.0):
-            sp = np.zeros(shape = (s2.shape[0] // 2, ))
-        else:
-            tm = np.arange(len(sig), dtype = np.float64) / 128.0
-            angular_freqs = np.linspace(2.0 * np.pi * min_freq,
-                                        2.0 * np.pi * max_freq, 100)
-#            pg = scipy.signal.lombscargle(tm, s2, angular_freqs)
-#            sp = np.sqrt(4 * (pg / tm.shape[0]))
-            s2 = s2 - np.mean(s2)
-            sp = np.abs(np.fft.rfft(s2))
+
+    def render_spectrum(self, sp, color, frame, surf):
+        """
+        Render a spectral representation of the signal given by its
+        magnitude spectrum sp (mean removed).
+        """
+        max_freq = self.spectrum.frequencies()[-1]
 
         # if there are any non-finite values, replace buffer with zeros
         if not np.all(np.isfinite(sp)):
@@ -145,7 +184,7 @@ class SignalRendererWidget(Widget):
 
         # draw spectral bands
         for f in [5.0, 10.0, 15.0, 20.0, 25.0, 30.0, 35.0, 40.0, 45.0]:
-            x = (f - min_freq) / max_freq * frame.width + frame.left
+            x = f / max_freq * frame.width + frame.left
             pygame.draw.line(surf, (0, 0, 0), (x, frame.top), (x, frame.bottom))
 
         # fixme: draw 20dB? yardstick
@@ -174,41 +213,65 @@ class SignalRendererWidget(Widget):
 
 
     def draw(self, surf):
-	"""
-	Draw the signals.  Here we expect the signal buffer to be updated.
-	"""
+        """
+        Draw the signals.  Here we expect the signal buffer to be updated.
+        """
         frame = surf.get_rect()
 
         pygame.draw.rect(surf, (255,255,255), frame)
 
-	# plot the signals
+        # plot the signals
         Nsig = len(self.selected)
         if Nsig == 0:
             return
 
-	gr_height = (frame.bottom - frame.top) // Nsig
-	gr_width = frame.width
-
-	# get a handle to the buffer
-	self.buf.pull_packets(self.dev)
-	buf = self.buf.buffer()
-
-	# for each signal repeat
-	for s, sndx in zip(self.selected, range(len(self.selected))):
+        gr_height = (frame.bottom - frame.top) // Nsig
+        gr_width = frame.width
+
+        # get a handle to the shown buffer, packets always go to the raw one
+        self.buf.pull_packets(self.dev)
+        shown = self.filtered if self.show_filtered else self.buf
+        spectrum = self.filtered_spectrum if self.show_filtered else self.spectrum
+        buf = shown.buffer()
+
+        # the means of the whole buffer are kept up to date by the buffer
+        means = None
+        if shown.stats is not None and self.span == shown.buf_len:
+            means = shown.stats.mean()
+
+        # the spectra of all channels are updated together
+        if any(self.display_type[s] != 0 for s in self.selected):
+            spectrum.update()
+            spectra = spectrum.magnitudes()
+
+        # long time spans are drawn from the decimated history, a span
+        # which fits into the pixels but not into the buffer is drawn
+        # from the finest level as the raw samples are gone
+        level = None
+        if self.history is not None and self.span > self.buf.buf_len:
+            level = self.history.level_for(self.span, gr_width)
+            if level is None:
+                level = self.history.levels[0]
+            mins, maxs = level.envelope(-(-self.span // level.factor))
+
+        # for each signal repeat
+        for s, sndx in zip(self.selected, range(len(self.selected))):
 
             # retrieve channel name
             chan_name = self.sig_list[s]
 
-	    # compute target rectangle
+            # compute target rectangle
             rect = pygame.Rect(frame.left, frame.top + gr_height * sndx, frame.width, gr_height)
 
             # render a time series representation
             color = (255, 0, 0) if sndx % 2 == 0 else (0, 0, 255)
-            if self.display_type[s] == 0:
-                self.render_time_series(buf[:,s], color, rect, surf)
+            if self.display_type[s] != 0:
+                self.render_spectrum(spectra[:,s], color, rect, surf)
+            elif level is not None:
+                self.render_envelope(mins[:,s], maxs[:,s], color, rect, surf)
             else:
-                self.render_spectrum(buf[:,s], color, rect, surf)
+                self.render_time_series(buf[-self.span:,s], color, rect, surf,
+                                        None if means is None else means[s])
 
             # draw the signal name
             self.render_name_and_contact_quality(chan_name, rect, surf)
-            
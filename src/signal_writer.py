@@ -2,46 +2,157 @@
 
 #
 #  This class is responsible for sinking a signal to a file.  The signal
-#  is stored as is (that is short samples) and written into a csv file.
+#  is stored as is (that is short samples) in the binary recording format
+#  described in signal_file.
 #
+#  Packets are only collected in memory by write_packet (which is called
+#  on the acquisition thread), a dedicated writer thread flushes them to
+#  the disk in large blocks.  If the disk stalls, the collected packets
+#  are bounded and the excess is dropped.  After a failed write nothing
+#  more is written, so the file holds whole records only.
 #
 
-import string
+import os
+import threading
+
+from signal_file import make_header, pack_record
+
+
+# fsync policies
+FSYNC_NEVER = 'never'
+FSYNC_FLUSH = 'flush'
+FSYNC_CLOSE = 'close'
 
 
 class SignalWriter:
     """
-    Stores acquired signals packets in a CSV file.
+    Stores acquired signals packets in a binary recording.
     """
 
 
-    def __init__(self):
+    def __init__(self, flush_interval = 1.0, flush_bytes = 64 * 1024,
+                 max_pending = 16 * 1024 * 1024, fsync = FSYNC_CLOSE):
         """
-        Initialize the writer.
+        Initialize the writer.  Collected packets are written every
+        flush_interval seconds or as soon as flush_bytes are pending.  At
+        most max_pending bytes are collected (0 for unbounded), further
+        packets are dropped and counted in dropped.  The fsync policy
+        selects if the file is synced after every flush, only when it is
+        closed or never.
         """
+        if fsync not in (FSYNC_NEVER, FSYNC_FLUSH, FSYNC_CLOSE):
+            raise ValueError('unknown fsync policy %r' % fsync)
+
         self.f = None
-        self.fmt = '%d'
+        self.flush_interval = flush_interval
+        self.flush_bytes = flush_bytes
+        self.max_pending = max_pending
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.writer = None
+        self.error = None
+        self.dropped = 0
 
 
-    def open(self, fname):
+    def open(self, fname, serial_num = '', sample_rate = 128):
         self.fname = fname
         try:
-            self.f = open(fname, 'w')
+            # unbuffered, a failed block must not be retried by a flush
+            self.f = open(fname, 'wb', 0)
+            self.f.write(make_header(serial_num, sample_rate = sample_rate))
         except IOError as ioe:
             print(ioe)
+            if self.f is not None:
+                self.f.close()
+                self.f = None
+            return
+
+        self.pending = []
+        self.pending_bytes = 0
+        self.error = None
+        self.dropped = 0
+        self.stop_requested = False
+        self.writer = threading.Thread(target = self.write_blocks)
+        self.writer.start()
 
     def close(self):
-        self.f.close()
-        self.f = None
+        # stop the writer thread, it flushes all pending packets
+        self.stop_requested = True
+        self.wakeup.set()
+        self.writer.join()
+        self.writer = None
+
+        # the file is closed even if the recording failed
+        try:
+            if self.fsync != FSYNC_NEVER and self.error is None:
+                os.fsync(self.f.fileno())
+        except (IOError, OSError) as ioe:
+            self.error = ioe
+            print(ioe)
+        finally:
+            self.f.close()
+            self.f = None
 
     def ready(self):
-        return self.f != None
+        """
+        True if the file is open and no write has failed (the failure is
+        kept in error).
+        """
+        return self.f != None and self.error is None
 
     def write_packet(self, p):
-        data = [p.counter, p.gyro_x, p.gyro_y]
-        data.extend(p.eeg)
-        data.append(p.cq_val if p.counter < 14 else -1)
+        """
+        Collect the packet for the writer thread, never touches the disk.
+        The packet is dropped if max_pending bytes are already collected
+        or a write has failed.
+        """
+        rec = pack_record(p)
+        with self.lock:
+            if self.error is not None or 0 < self.max_pending < self.pending_bytes + len(rec):
+                self.dropped += 1
+                return
+            self.pending.append(rec)
+            self.pending_bytes += len(rec)
+            flush_now = self.pending_bytes >= self.flush_bytes
+
+        if flush_now:
+            self.wakeup.set()
+
+
+    def write_blocks(self):
+        """
+        Body of the writer thread: periodically write all collected packets
+        as one block until stop is requested.  After the first failed
+        write, the collected packets are only counted as dropped.
+        """
+        while True:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            stop = self.stop_requested
+
+            # take over the collected packets
+            with self.lock:
+                blocks = self.pending
+                self.pending = []
+                self.pending_bytes = 0
+
+            if self.error is not None:
+                with self.lock:
+                    self.dropped += len(blocks)
+            elif len(blocks) > 0:
+                written = False
+                try:
+                    self.f.write(''.join(blocks))
+                    written = True
+                    if self.fsync == FSYNC_FLUSH:
+                        os.fsync(self.f.fileno())
+                except (IOError, OSError) as ioe:
+                    self.error = ioe
+                    if not written:
+                        with self.lock:
+                            self.dropped += len(blocks)
+                    print(ioe)
 
-        self.f.write(string.join([str(s) for s in data], ', '))
-        self.f.write('\n')
-            
+            if stop:
+                break
@@ -0,0 +1,106 @@
+
+#
+#  Spectral analysis of (N, channels) signal blocks.  All channels are
+#  transformed by one rfft along axis 0; the windows, the frequency bins
+#  and the band masks depend only on the block length and the sample rate
+#  and are cached.
+#
+
+import numpy as np
+import scipy.signal
+
+
+# the classic EEG bands as (name, low [Hz], high [Hz])
+EEG_BANDS = (('delta', 0.5, 4.0),
+             ('theta', 4.0, 8.0),
+             ('alpha', 8.0, 13.0),
+             ('beta', 13.0, 30.0),
+             ('gamma', 30.0, 45.0))
+
+_windows = {}
+_frequencies = {}
+_band_masks = {}
+
+
+def get_window(name, n):
+    """
+    Return the (cached) periodic window name (see scipy.signal.get_window)
+    of length n as a column so that it broadcasts over the channels of a
+    block.
+    """
+    key = (name, n)
+    if key not in _windows:
+        _windows[key] = scipy.signal.get_window(name, n)[:, np.newaxis]
+    return _windows[key]
+
+
+def frequencies(n, sample_rate = 128.0):
+    """
+    Return the (cached) frequencies [Hz] of the rfft bins of n samples.
+    """
+    key = (n, sample_rate)
+    if key not in _frequencies:
+        _frequencies[key] = np.arange(n // 2 + 1) * (float(sample_rate) / n)
+    return _frequencies[key]
+
+
+def band_masks(n, sample_rate = 128.0, bands = EEG_BANDS):
+    """
+    Return the (cached) boolean (bins, bands) matrix selecting the rfft
+    bins of n samples that fall into each band [low, high).
+    """
+    key = (n, sample_rate, bands)
+    if key not in _band_masks:
+        f = frequencies(n, sample_rate)[:, np.newaxis]
+        low = np.array([ b[1] for b in bands ])
+        high = np.array([ b[2] for b in bands ])
+        _band_masks[key] = (f >= low) & (f < high)
+    return _band_masks[key]
+
+
+def spectra(block, window = 'boxcar', detrend = True):
+    """
+    Return the complex rfft (bins, channels) of all channels of the
+    (N, channels) block, optionally with the channel means removed and
+    windowed.
+    """
+    x = block.astype(np.float64)
+    if detrend:
+        x -= np.mean(x, axis = 0)
+    if window != 'boxcar':
+        x *= get_window(window, x.shape[0])
+    return np.fft.rfft(x, axis = 0)
+
+
+def magnitude_spectra(block, window = 'boxcar'):
+    """
+    Return the magnitude spectra (bins, channels) of the mean removed
+    channels of block.
+    """
+    return np.abs(spectra(block, window))
+
+
+def power_spectra(block, sample_rate = 128.0, window = 'hann'):
+    """
+    Return the one-sided power spectral densities [units^2/Hz] (bins,
+    channels) of the mean removed, windowed channels of block.
+    """
+    n = block.shape[0]
+    w = get_window(window, n)
+    psd = np.abs(spectra(block, window)) ** 2 / (sample_rate * np.sum(w ** 2))
+
+    # fold the negative frequencies (not DC and not Nyquist)
+    if n % 2 == 0:
+        psd[1:-1] *= 2.0
+    else:
+        psd[1:] *= 2.0
+    return psd
+
+
+def band_powers(psd, n, sample_rate = 128.0, bands = EEG_BANDS):
+    """
+    Integrate the power spectral densities psd (bins, channels) of n
+    sample blocks over the bands, returns a (channels, bands) array.
+    """
+    masks = band_masks(n, sample_rate, bands)
+    return np.dot(psd.T, masks) * (float(sample_rate) / n)
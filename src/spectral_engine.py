@@ -0,0 +1,106 @@
+
+#
+#  Streaming spectrum of the last N samples of all channels of a
+#  SignalBuffer.  The spectra are kept as sliding DFT state and updated
+#  from the newly appended samples only:
+#
+#    X_k(t+1) = (X_k(t) + x(t) - x(t-N)) * exp(2j*pi*k/N)
+#
+#  which for m new samples collapses into one (bins x m) by (m x channels)
+#  product.  A full recompute (one 2-D rfft over all channels) is done when
+#  the outgoing samples are no longer in the buffer (no slack), after a
+#  clear, when more than N samples arrived and periodically to stop the
+#  rounding errors from accumulating.
+#
+
+import numpy as np
+
+import spectral_analysis
+
+
+class SlidingSpectrum:
+    """
+    Sliding DFT of the last n samples of every channel of a SignalBuffer.
+    """
+
+    def __init__(self, sig_buf, n = None, recompute_every = None):
+        """
+        Follow sig_buf, the spectra cover the last n samples (buf_len by
+        default).  The sliding update needs the n + new samples in the
+        buffer, give the buffer slack of at least the samples appended
+        between updates.  A full recompute is forced every recompute_every
+        samples (n by default).
+        """
+        self.sig_buf = sig_buf
+        self.n = sig_buf.buf_len if n is None else n
+        self.recompute_every = self.n if recompute_every is None else recompute_every
+        if self.n > sig_buf.capacity:
+            raise ValueError('spectrum of %d samples exceeds capacity %d' % (self.n, sig_buf.capacity))
+
+        self.bins = np.arange(self.n // 2 + 1)
+        self.spectra = np.zeros((len(self.bins), sig_buf.sig_cnt), dtype = np.complex128)
+
+        # absolute index of the next sample & epoch the spectra belong to
+        self.pos = None
+        self.epoch = None
+        self.since_recompute = 0
+        self.recomputes = 0
+
+
+    def recompute(self):
+        """
+        Compute the spectra of all channels from the buffer with one FFT.
+        """
+        win = self.sig_buf.window(self.n)
+        self.spectra[:] = spectral_analysis.spectra(win.data, detrend = False)
+        self.pos = win.end()
+        self.epoch = win.epoch
+        self.since_recompute = 0
+        self.recomputes += 1
+
+
+    def update(self):
+        """
+        Bring the spectra up to the current end of the buffer.
+        """
+        sb = self.sig_buf
+        new = sb.total - self.pos if self.pos is not None else None
+
+        if new is None or self.epoch != sb.epoch or new > min(self.n, sb.capacity - self.n) \
+           or self.since_recompute + new > self.recompute_every:
+            self.recompute()
+            return
+
+        if new == 0:
+            return
+
+        # samples entering and leaving the window
+        x_in = sb.window(new, sb.total).data.astype(np.float64)
+        x_out = sb.window(new, sb.total - self.n).data
+        delta = x_in - x_out
+
+        # sample i of the m new ones is rotated m - i times
+        m = np.arange(new, 0, -1)
+        rot = np.exp(2j * np.pi * np.outer(self.bins, m) / self.n)
+        self.spectra *= rot[:, :1]
+        self.spectra += np.dot(rot, delta)
+
+        self.pos = sb.total
+        self.since_recompute += new
+
+
+    def magnitudes(self):
+        """
+        Return the (bins x channels) magnitude spectra with the mean (DC bin)
+        removed.
+        """
+        sp = np.abs(self.spectra)
+        sp[0, :] = 0.0
+        return sp
+
+
+    def frequencies(self, sample_rate = 128.0):
+        """
+        Frequencies of the bins in Hz.
+        """
+        return spectral_analysis.frequencies(self.n, sample_rate)
@@ -2,6 +2,7 @@
 import sys
 import os
 
+import numpy as np
 import pygame
 from pygame import Rect
 
@@ -18,12 +19,20 @@ import albow.file_dialogs
 
 from emotiv_device_monitor import EmotivDeviceMonitor
 from emotiv_device import EmotivDevice
+from replay_device import ReplayEmotivDevice
 from signal_buffer import SignalBuffer
+from signal_history import SignalHistory
+from band_power import BandPowerMonitor
+from signal_filter import RealTimeFilter
 from signal_writer import SignalWriter
 from signal_renderer_widget import SignalRendererWidget
 from emotiv_data_packet import counter_to_sensor_id
 
 
+# selectable displayed time spans in seconds
+time_spans = [ 6, 30, 120, 600, 3600 ]
+
+
 class WaveRiderGUI(RootWidget):
     """
     The GUI elements of the main screen for wave rider.
@@ -37,8 +46,19 @@ class WaveRiderGUI(RootWidget):
 
         self.recording_in_progress = False
 
-        # signal buffer stores 6 seconds of data
-        self.sig_buf = SignalBuffer(768, 14)
+        # signal buffer stores 6 seconds of raw levels, the history
+        # keeps decimated levels for longer time spans, the slack keeps
+        # the samples leaving the window around for the sliding spectrum
+        self.sig_buf = SignalBuffer(768, 14, slack = 128, dtype = np.uint16, track_stats = True)
+        self.history = SignalHistory(14)
+        self.sig_buf.add_sink(self.history.append)
+        self.span_ndx = 0
+
+        # DC removed, notched & bandpassed signals for display
+        self.filter = RealTimeFilter(self.sig_buf)
+
+        # band powers of all channels, updated every second
+        self.band_power = BandPowerMonitor(self.sig_buf)
 
         # add status update callbacks to the device monitor
         mon.callbacks.append(self.update_device_status)
@@ -53,7 +73,9 @@ class WaveRiderGUI(RootWidget):
         self.renderer = SignalRendererWidget(counter_to_sensor_id,
                                              dev,
                                              self.sig_buf,
-                                             Rect(0, 0, 880, 660))
+                                             Rect(0, 0, 880, 660),
+                                             history = self.history,
+                                             filtered = self.filter.output)
         self.add(self.renderer)
 
         c = Column([
@@ -69,7 +91,18 @@ class WaveRiderGUI(RootWidget):
                        bg_color = (0, 0, 128),
                        height = 30,
                        margin = 3),
-                Widget(height = 70),
+                Label('Time Span', height = 30),
+                Row( [
+                        Button("+",
+                               action = lambda: self.update_span(+1),
+                               bg_color = (80, 100, 40),
+                               width = 30,
+                               margin = 5),
+                        Button("-",
+                               action = lambda: self.update_span(-1),
+                               bg_color = (80, 100, 40),
+                               margin = 5,
+                               width = 30) ]),
                 Label('Gyro Data', height = 30),
                 self.gyrox_label,
                 self.gyroy_label,
@@ -92,11 +125,19 @@ class WaveRiderGUI(RootWidget):
                                margin = 5,
                                width = 30) ]),
                 self.signal_mag_label,
-                Button("Clear",
-                       action = lambda: self.sig_buf.clear(),
-                       bg_color = (255, 0, 0),
-                       height = 30,
-                       margin = 5),
+                Row( [
+                        Button("Filter",
+                               action = lambda: self.renderer.toggle_filtered(),
+                               font = small_font,
+                               bg_color = (80, 100, 40),
+                               height = 30,
+                               margin = 5),
+                        Button("Clear",
+                               action = self.clear_signals,
+                               font = small_font,
+                               bg_color = (255, 0, 0),
+                               height = 30,
+                               margin = 5) ]),
                 Label('Channels', width = 100, bg_color = (50, 50, 255)),
                 Grid([ [ Button("F3", font = small_font, action = lambda: self.renderer.toggle_channel(0)),
                          Button("FC5", font = small_font, action = lambda: self.renderer.toggle_channel(1)),
@@ -131,9 +172,12 @@ class WaveRiderGUI(RootWidget):
 
         self.stat_label = Label('', 100, margin = 3)
         self.packet_speed_label = Label('', 100, margin = 3)
-        self.recording_label = Label('NOT RECORDING', 400, margin = 3)
+        self.recording_label = Label('NOT RECORDING', 280, margin = 3)
         self.battery_label = Label('NO DATA', 100, margin = 3)
-        r = Row([ self.stat_label, self.packet_speed_label, self.battery_label, self.recording_label, Widget(width = 50, height = 30) ],
+        self.span_label = Label('', 100, margin = 3)
+        self.alpha_label = Label('', 100, margin = 3)
+        r = Row([ self.stat_label, self.packet_speed_label, self.battery_label, self.span_label,
+                  self.alpha_label, self.recording_label ],
                 rect = Rect(0, 660, 880, 30),
                 width = 880,
                 height = 30,
@@ -152,7 +196,9 @@ class WaveRiderGUI(RootWidget):
         self.renderer = SignalRendererWidget(counter_to_sensor_id,
                                              dev,
                                              self.sig_buf,
-                                             Rect(0, 0, 880, 660))
+                                             Rect(0, 0, 880, 660),
+                                             history = self.history,
+                                             filtered = self.filter.output)
         self.add(self.renderer)
 
         self.update_ps_counter = 0
@@ -189,6 +235,19 @@ class WaveRiderGUI(RootWidget):
             self.gyroy_label.text = 'Y = %d' % dev.gyro_y
         
 
+    def update_span(self, step):
+        """
+        Move to the next longer/shorter displayed time span.
+        """
+        self.span_ndx = max(0, min(len(time_spans) - 1, self.span_ndx + step))
+        self.renderer.set_span(time_spans[self.span_ndx] * 128)
+
+
+    def clear_signals(self):
+        self.sig_buf.clear()
+        self.filter.clear()
+
+
     def toggle_cursor_rendering(self):
         if self.render_cursor == False:
             self.sq_pos = (400, 300)
@@ -203,12 +262,31 @@ class WaveRiderGUI(RootWidget):
         self.signal_mag_label.text = 'mag: %gx' % self.renderer.multiplier
         self.signal_mag_label.invalidate()
 
+        span = time_spans[self.span_ndx]
+        self.span_label.text = 'SPAN: %d %s' % ((span, 's') if span < 60 else (span // 60, 'min'))
+        self.span_label.invalidate()
+
         if dev.battery is not None:
             self.battery_label.text = 'BATT: %d%%' % (dev.battery * 100) 
         else:
             self.battery_label.text = 'NO DATA'
         self.battery_label.invalidate()
 
+        # share of the alpha band averaged over all channels
+        self.band_power.update()
+        alpha = self.band_power.relative_powers()[:, self.band_power.band_names.index('alpha')]
+        self.alpha_label.text = 'ALPHA: %d%%' % (np.mean(alpha) * 100)
+        self.alpha_label.invalidate()
+
+        # a failing recording is reported in the recording label
+        if self.rec is not None and not self.rec.ready():
+            self.recording_label.text = 'RECORDING FAILED: %s' % self.rec.error
+            self.recording_label.invalidate()
+        elif self.rec is not None and self.rec.dropped > 0:
+            self.recording_label.text = 'Recording to [%s], %d dropped' % (
+                os.path.basename(self.rec.fname), self.rec.dropped)
+            self.recording_label.invalidate()
+
         # no sense in updating if we are not going to use it
         if self.render_cursor and (dev.gyro_x is not None) and (dev.gyro_y is not None):
             new_pos_x = max(20, min(800, self.sq_pos[0] + (105 - dev.gyro_x) * 4)) if abs(dev.gyro_x - 105) > 1 else self.sq_pos[0]
@@ -235,13 +313,13 @@ class WaveRiderGUI(RootWidget):
             albow.dialogs.alert('Recording in progress!')
             return
 
-        fname = albow.file_dialogs.request_new_filename("Select output file ...", suffix = "csv", directory = 'data')
+        fname = albow.file_dialogs.request_new_filename("Select output file ...", suffix = "rec", directory = 'data')
         if fname is None:
             return
 
         # start the recording
         self.rec = SignalWriter()
-        self.rec.open(fname)
+        self.rec.open(fname, dev.serial_num)
 
         if not self.rec.ready():
             albow.dialogs.alert("File cannot be opened, cancelling recording.")
@@ -301,14 +379,24 @@ class WaveRiderGUI(RootWidget):
 
 if __name__ == '__main__':
 
+    # a recorded session may be replayed instead of reading the headset:
+    #   wave_rider.py [recording [speed]]   (speed 0 = as fast as possible)
+    replay_fname = sys.argv[1] if len(sys.argv) > 1 else None
+    replay_speed = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+
     # init the pygae subsystem
     pygame.init()
     display = pygame.display.set_mode((1000,700), 0)
 
     # init the device & monitor
-    mon = EmotivDeviceMonitor()
-    dev = EmotivDevice('SN20120229000254') # moje
-#    dev = EmotivDevice('SN20120229000348') # jarovo
+    if replay_fname is not None:
+        mon = EmotivDeviceMonitor(replay_fname)
+        dev = ReplayEmotivDevice(replay_fname, speed = replay_speed or None, loop = True,
+                                 queue_packets = False, dtype = np.uint16)
+    else:
+        mon = EmotivDeviceMonitor()
+        dev = EmotivDevice('SN20120229000254', queue_packets = False, dtype = np.uint16) # moje
+#        dev = EmotivDevice('SN20120229000348', queue_packets = False, dtype = np.uint16) # jarovo
 
     # create the main GUI window
     rootwidget = WaveRiderGUI(display)
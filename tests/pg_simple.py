@@ -7,7 +7,7 @@ import numpy as np
 from emotiv_device import EmotivDevice
 from signal_buffer import SignalBuffer
 from signal_writer import SignalWriter
-#from signal_filter import RealTimeFilter
+from signal_filter import RealTimeFilter
 
 
 # definitions and initializations
@@ -27,17 +27,20 @@ if __name__ == '__main__':
 
     # signal writer for storing samples
     sw = SignalWriter()
-    sw.open('signal.csv')
+    sw.open('signal.rec', 'SN20120229000254')
     print("Signal writer is ready: %s" % sw.ready())
 
     # initialize the devices & buffer
-    dev = EmotivDevice('SN20120229000254')
+    dev = EmotivDevice('SN20120229000254', queue_packets = False)
     dev.subscribe(sw.write_packet)
     dev.start_reader()
 
     # signal buffer for reading samples from the EEG
     eeg = SignalBuffer(750, 14)
 
+    # the filtered signals are drawn
+    filt = RealTimeFilter(eeg)
+
     # PyGame subsystem init
     pygame.init()
     Clock = pygame.time.Clock()
@@ -70,8 +73,8 @@ if __name__ == '__main__':
             gr_height = 600 // 14
             gr_width = 750
 
-            # get a handle to the buffer
-            buf = eeg.buffer()
+            # get a handle to the filtered buffer
+            buf = filt.output.buffer()
 
             for s in range(14):
                 chan_name = counter_to_sensor_id[s]
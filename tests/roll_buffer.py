@@ -1,7 +1,9 @@
 
+import sys
 import time
 
 from emotiv_device import EmotivDevice
+from replay_device import ReplayEmotivDevice
 from emotiv_data_packet import EmotivDataPacket
 from signal_buffer import SignalBuffer
 
@@ -11,7 +13,11 @@ if __name__ == '__main__':
     
     print("Setting up device ...")
 
-    dev = EmotivDevice('SN20120229000254')
+    # replay a recording if one is given, otherwise read the headset
+    if len(sys.argv) > 1:
+        dev = ReplayEmotivDevice(sys.argv[1], queue_packets = False)
+    else:
+        dev = EmotivDevice('SN20120229000254', queue_packets = False)
     
     print("Starting reader ...")
 
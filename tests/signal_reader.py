@@ -1,6 +1,9 @@
 
 
+import sys
+
 from emotiv_device import EmotivDevice
+from replay_device import ReplayEmotivDevice
 from emotiv_data_packet import EmotivDataPacket
 
 
@@ -8,7 +11,11 @@ if __name__ == '__main__':
     
     print("Setting up device ...")
 
-    dev = EmotivDevice('SN20120229000254')
+    # replay a recording if one is given, otherwise read the headset
+    if len(sys.argv) > 1:
+        dev = ReplayEmotivDevice(sys.argv[1])
+    else:
+        dev = EmotivDevice('SN20120229000254')
     
     print("Starting reader ...")
 